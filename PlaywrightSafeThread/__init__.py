@@ -1 +1,4 @@
-from PlaywrightSafeThread.browser.threadsafe_browser import ThreadsafeBrowser
\ No newline at end of file
+from PlaywrightSafeThread.browser.threadsafe_browser import ThreadsafeBrowser
+from PlaywrightSafeThread.browser.page_pool import PagePool, PoolExhausted
+from PlaywrightSafeThread.browser.batch_eval import EvaluationError
+from PlaywrightSafeThread.browser.browser_pool import ThreadsafeBrowserPool
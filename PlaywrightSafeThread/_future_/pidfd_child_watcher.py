@@ -0,0 +1,90 @@
+# from: https://github.com/python/cpython/blob/3.12/Lib/asyncio/unix_events.py
+import os
+from asyncio import get_running_loop
+from asyncio.log import logger
+
+from PlaywrightSafeThread._future_.threaded_child_watcher import AbstractChildWatcher, _compute_returncode
+
+
+def can_use_pidfd():
+    if not hasattr(os, "pidfd_open"):
+        return False
+    try:
+        pid = os.getpid()
+        os.close(os.pidfd_open(pid, 0))
+    except OSError:
+        # blocked by security policy like SECCOMP
+        return False
+    return True
+
+
+class PidfdChildWatcher(AbstractChildWatcher):
+    """Child watcher implementation using Linux's pid file descriptors.
+
+    This child watcher polls process file descriptors (pidfds) to await child
+    process termination. In some respects, PidfdChildWatcher is a "Goldilocks"
+    child watcher implementation. It doesn't require signals or threads, doesn't
+    interfere with any processes launched outside the event loop, and scales
+    linearly with the number of subprocesses launched by the event loop. The
+    main disadvantage is that pidfds are specific to Linux, and only work on
+    recent (5.3+) kernels.
+
+    The pidfd is registered with the selector of the loop that spawned the
+    process, so watching the playwright driver costs no extra thread.
+    """
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        pass
+
+    def is_active(self):
+        return True
+
+    def close(self):
+        pass
+
+    def attach_loop(self, loop):
+        pass
+
+    def add_child_handler(self, pid, callback, *args):
+        loop = get_running_loop()
+        try:
+            pidfd = os.pidfd_open(pid)
+        except ProcessLookupError:
+            # The child process is already reaped
+            logger.warning(
+                "Unknown child process pid %d, will report returncode 255", pid
+            )
+            loop.call_soon(callback, pid, 255, *args)
+            return
+        loop.add_reader(pidfd, self._do_wait, loop, pid, pidfd, callback, args)
+
+    def _do_wait(self, loop, pid, pidfd, callback, args):
+        loop.remove_reader(pidfd)
+        try:
+            _, status = os.waitpid(pid, 0)
+        except ChildProcessError:
+            # The child process is already reaped
+            # (may happen if waitpid() is called elsewhere).
+            returncode = 255
+            logger.warning(
+                "child process pid %d exit status already read: "
+                " will report returncode 255",
+                pid)
+        else:
+            returncode = _compute_returncode(status)
+            if loop.get_debug():
+                logger.debug(
+                    "process %s exited with returncode %s", pid, returncode
+                )
+
+        os.close(pidfd)
+        callback(pid, returncode, *args)
+
+    def remove_child_handler(self, pid):
+        # asyncio never calls remove_child_handler() !!!
+        # The method is no-op but is implemented because
+        # abstract base classes requires it.
+        return True
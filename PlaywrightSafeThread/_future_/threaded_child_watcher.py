@@ -1,11 +1,19 @@
 # from: https://github.com/python/cpython/blob/3.8/Lib/asyncio/unix_events.py
 import os
 import itertools
+import sys
 import threading
 import warnings
 from asyncio import get_running_loop
 from asyncio.log import logger
 
+# NOTE: asyncio.set_child_watcher() only accepts subclasses of its own base,
+# which is deprecated in 3.12 and removed in 3.14
+if sys.version_info < (3, 12):
+    from asyncio import AbstractChildWatcher as _BaseChildWatcher
+else:
+    _BaseChildWatcher = object
+
 
 def _compute_returncode(status):
     if os.WIFSIGNALED(status):
@@ -21,7 +29,7 @@ def _compute_returncode(status):
         return status
 
 
-class AbstractChildWatcher:
+class AbstractChildWatcher(_BaseChildWatcher):
     """Abstract base class for monitoring child processes.
 
     Objects derived from this class monitor a collection of subprocesses and
@@ -116,6 +124,8 @@ class ThreadedChildWatcher(AbstractChildWatcher):
     def __init__(self):
         self._pid_counter = itertools.count(0)
         self._threads = {}
+        # NOTE: _threads is mutated from the waitpid threads
+        self._threads_lock = threading.Lock()
 
     def is_active(self):
         return True
@@ -125,11 +135,12 @@ class ThreadedChildWatcher(AbstractChildWatcher):
 
     def _join_threads(self):
         """Internal: Join all non-daemon threads"""
-        threads = [
-            thread
-            for thread in list(self._threads.values())
-            if thread.is_alive() and not thread.daemon
-        ]
+        with self._threads_lock:
+            threads = [
+                thread
+                for thread in self._threads.values()
+                if thread.is_alive() and not thread.daemon
+            ]
         for thread in threads:
             thread.join()
 
@@ -140,9 +151,10 @@ class ThreadedChildWatcher(AbstractChildWatcher):
         pass
 
     def __del__(self, _warn=warnings.warn):
-        threads = [
-            thread for thread in list(self._threads.values()) if thread.is_alive()
-        ]
+        with self._threads_lock:
+            threads = [
+                thread for thread in self._threads.values() if thread.is_alive()
+            ]
         if threads:
             _warn(
                 f"{self.__class__} has registered but not finished child processes",
@@ -158,7 +170,8 @@ class ThreadedChildWatcher(AbstractChildWatcher):
             args=(loop, pid, callback, args),
             daemon=True,
         )
-        self._threads[pid] = thread
+        with self._threads_lock:
+            self._threads[pid] = thread
         thread.start()
 
     def remove_child_handler(self, pid):
@@ -195,4 +208,5 @@ class ThreadedChildWatcher(AbstractChildWatcher):
         else:
             loop.call_soon_threadsafe(callback, pid, returncode, *args)
 
-        self._threads.pop(expected_pid)
+        with self._threads_lock:
+            self._threads.pop(expected_pid, None)
@@ -0,0 +1,97 @@
+import functools
+from typing import (
+    Any,
+    Dict,
+    Iterable,
+    List,
+    Tuple,
+    Union,
+)
+
+# NOTE: one `() => (<expression>)` per item in a single function, no `eval` in the page (CSP)
+_RUN = """async (args) => {
+  const run = async (index, make) => {
+    try {
+      let value = make();
+      if (typeof value === "function") value = value(args[index]);
+      return [true, await value];
+    } catch (e) {
+      return [false, e instanceof Error ? e.name + ": " + e.message : String(e)];
+    }
+  };
+  return Promise.all([
+%s
+  ]);
+}"""
+
+_EXTRACT = """(fields) => fields.map(([selector, kind, name, all]) => {
+  const read = (element) => {
+    if (kind === "attribute") return element.getAttribute(name);
+    const value = element[name];
+    return typeof value === "string" && name === "textContent" ? value.trim() : value;
+  };
+  if (all) return Array.from(document.querySelectorAll(selector), read);
+  const element = document.querySelector(selector);
+  return element === null ? null : read(element);
+})"""
+
+
+class EvaluationError(Exception):
+    """An expression of `evaluate_many` threw in the page."""
+
+
+@functools.lru_cache(maxsize=256)
+def _batch_source(expressions: Tuple[str, ...]) -> str:
+    # NOTE: newline before ")", an expression may end with a // comment
+    return _RUN % ",\n".join("    run(%i, () => (%s\n))" % item for item in enumerate(expressions))
+
+
+def _split(item: Union[str, Tuple[str, Any]]) -> Tuple[str, Any]:
+    if isinstance(item, str):
+        return item, None
+    expression, arg = item
+    return expression, arg
+
+
+async def evaluate_many(page, expressions_with_args: Iterable[Union[str, Tuple[str, Any]]],
+                        return_exceptions: bool = True) -> list:
+    """
+    Evaluate expressions (like `page.evaluate`: a JS expression, or a function called with its arg)
+    in one round trip. `expressions_with_args` items are "expression" or ("expression", arg).
+
+    Results come in the same order, an expression that threw gives an `EvaluationError` (raised
+    when `return_exceptions` is False), the others still run. A syntax error fails the whole batch.
+    """
+    items = [_split(item) for item in expressions_with_args]
+    if not items:
+        return []
+    expressions, args = zip(*items)
+    results = []
+    for ok, value in await page.evaluate(_batch_source(expressions), list(args)):
+        if not ok:
+            value = EvaluationError(value)
+            if not return_exceptions:
+                raise value
+        results.append(value)
+    return results
+
+
+def _field(spec: Union[str, dict]) -> list:
+    if isinstance(spec, str):
+        return [spec, "property", "textContent", False]
+    if "attribute" in spec:
+        kind, name = "attribute", spec["attribute"]
+    else:
+        kind, name = "property", spec.get("property", "textContent")
+    return [spec["selector"], kind, name, bool(spec.get("all", False))]
+
+
+async def extract(page, schema: Dict[str, Union[str, dict]]) -> Dict[str, Any]:
+    """
+    Read many CSS selectors in one round trip. `schema` maps a name to a selector (its trimmed
+    text) or to {"selector": ..., "attribute": "href"} / {"property": "value"}, "all": True gives
+    a list of every match. A missing element gives None.
+    """
+    names = list(schema)
+    values: List[Any] = await page.evaluate(_EXTRACT, [_field(schema[name]) for name in names])
+    return dict(zip(names, values))
@@ -0,0 +1,129 @@
+import asyncio
+import itertools
+from threading import Lock
+from typing import (
+    Hashable,
+    List,
+    Literal,
+    Optional,
+)
+
+from PlaywrightSafeThread.browser.threadsafe_browser import ThreadsafeBrowser
+
+RoutingPolicy = Literal["least_loaded", "round_robin", "sticky"]
+ROUTING_POLICIES = ("least_loaded", "round_robin", "sticky")
+
+
+class ThreadsafeBrowserPool:
+    """
+    Shard work over `size` ThreadsafeBrowser instances, each one with its own loop thread
+    and browser process, so protocol handling is spread over several cores.
+
+    Callables given to `run_threadsafe`/`create_task` receive the selected browser as first
+    argument, ex: `pool.run_threadsafe(lambda th: th.page.goto(url))`. Coroutines are run as
+    is, they must not be bound to a page of a given browser.
+
+    Routing `policy`:
+        - "least_loaded": browser with the fewest in-flight submissions
+        - "round_robin": browsers in turn
+        - "sticky": same `key_` always goes to the same browser, falls back to least loaded without key
+    """
+
+    def __init__(self, size: int = 2, policy: RoutingPolicy = "least_loaded", **kwargs):
+        if size < 1:
+            raise ValueError("size must be >= 1")
+        if policy not in ROUTING_POLICIES:
+            raise TypeError("unsupported routing policy")
+
+        self.policy = policy
+        kwargs.pop("start", None)
+        self.browsers: List[ThreadsafeBrowser] = [ThreadsafeBrowser(start=False, **kwargs) for _ in range(size)]
+        # NOTE: browsers start in parallel, each one on its own thread
+        errors = [future.exception() for future in [th.start() for th in self.browsers]]
+        error = next((e for e in errors if e is not None), None)
+        if error is not None:
+            self.sync_close()
+            raise error
+
+        self._in_flight = [0] * size
+        self._in_flight_lock = Lock()
+        self._round_robin = itertools.count()
+
+    def __len__(self):
+        return len(self.browsers)
+
+    def __iter__(self):
+        return iter(self.browsers)
+
+    @property
+    def loads(self) -> List[int]:
+        return list(self._in_flight)
+
+    def pick(self, key_: Optional[Hashable] = None) -> ThreadsafeBrowser:
+        return self.browsers[self._pick_index(key_)]
+
+    def _pick_index(self, key: Optional[Hashable]) -> int:
+        size = len(self.browsers)
+        if self.policy == "round_robin":
+            return next(self._round_robin) % size
+        if self.policy == "sticky" and key is not None:
+            return hash(key) % size
+
+        loads = self._in_flight
+        return min(range(size), key=loads.__getitem__)
+
+    def _acquire(self, key: Optional[Hashable]) -> int:
+        with self._in_flight_lock:
+            index = self._pick_index(key)
+            self._in_flight[index] += 1
+        return index
+
+    def _release(self, index: int):
+        with self._in_flight_lock:
+            self._in_flight[index] -= 1
+
+    @staticmethod
+    def _make_task(th: ThreadsafeBrowser, task, args, kwargs):
+        if asyncio.iscoroutine(task):
+            return task
+        return task(th, *args, **kwargs)
+
+    def run_threadsafe(self, task, *args, key_: Optional[Hashable] = None, timeout_=120, **kwargs):
+        index = self._acquire(key_)
+        try:
+            th = self.browsers[index]
+            return th.run_threadsafe(self._make_task(th, task, args, kwargs), timeout_=timeout_)
+        finally:
+            self._release(index)
+
+    async def create_task(self, task, *args, key_: Optional[Hashable] = None, **kwargs):
+        index = self._acquire(key_)
+        try:
+            th = self.browsers[index]
+            return await th.create_task(self._make_task(th, task, args, kwargs))
+        finally:
+            self._release(index)
+
+    def stop(self):
+        for th in self.browsers:
+            th.stop()
+
+    def sync_close(self, timeout_=60):
+        for th in self.browsers:
+            try:
+                th.sync_close(timeout_=timeout_)
+            except Exception:
+                pass
+
+    async def close(self):
+        for th in self.browsers:
+            try:
+                await th.close()
+            except Exception:
+                pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.sync_close()
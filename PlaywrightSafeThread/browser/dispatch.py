@@ -0,0 +1,347 @@
+import asyncio
+import collections
+import functools
+import logging
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from typing import (
+    Hashable,
+    Optional,
+    Set,
+)
+
+from PlaywrightSafeThread.browser.metrics import DispatchMetrics, operation_name
+from PlaywrightSafeThread.browser.scheduler import Job, Scheduler
+from PlaywrightSafeThread.browser.tracing import ChromeTracer, now_us
+
+Logger = logging.getLogger("PlaywrightSafeThread")
+
+
+class Dispatcher:
+    """
+    Hand coroutines from any thread over to one event loop.
+
+    Submissions are appended to a deque and the loop is woken up only when no wakeup
+    is already pending, so a burst of submissions costs one `call_soon_threadsafe`.
+    In-flight futures are kept in a plain set (add/discard are atomic), no lock is
+    taken on the hot path.
+
+    Cancelling a future (or timing out in `wait`, or the `timeout` given to `submit`) cancels
+    the task on the loop, a task still running `cancel_grace` seconds later is counted as leaked.
+
+    With `metrics` and/or `tracer`, every submission is recorded under its operation
+    name (coroutine qualname unless given).
+
+    With `scheduler`, submissions reaching the loop go through a `Scheduler` (key
+    serialization, in-flight cap, priorities, fairness between caller threads)
+    instead of starting right away. Submissions with `bypass` start right away anyway:
+    ThreadsafeBrowser internals (pool, event listeners, recycle) that must not wait
+    behind the calls they would unblock.
+
+    `pause()` holds new submissions back until `resume()`, `drain()` waits for the
+    tasks already started, ex: to swap the browser context under them. `bypass`
+    submissions are neither held back nor waited for.
+    """
+
+    def __init__(
+            self,
+            loop: asyncio.AbstractEventLoop,
+            cancel_grace: Optional[float] = 5.0,
+            metrics: Optional[DispatchMetrics] = None,
+            tracer: Optional[ChromeTracer] = None,
+            scheduler: bool = False,
+            max_in_flight: Optional[int] = None,
+    ):
+        self.loop = loop
+        self.metrics = metrics
+        self.tracer = tracer
+        self.scheduler: Optional[Scheduler] = None
+        if scheduler or max_in_flight is not None:
+            self.scheduler = Scheduler(self._start_job, self._skip_job, max_in_flight=max_in_flight)
+        self.thread_id: Optional[int] = None
+        self.running_futures: Set[Future] = set()
+        self.cancel_grace = cancel_grace
+
+        self.timed_out = 0
+        self.cancelled = 0
+        self.leaked = 0
+
+        self._queue = collections.deque()
+        self._wakeup_pending = False
+        self._paused = False
+        # submissions that reached the loop while paused
+        self._held = collections.deque()
+        self._active: Set[asyncio.Task] = set()
+
+    def bind(self):
+        # Must be called from the thread running the loop
+        self.thread_id = threading.get_ident()
+
+    @property
+    def in_loop_thread(self) -> bool:
+        return threading.get_ident() == self.thread_id
+
+    def submit(
+            self,
+            coro,
+            name: Optional[str] = None,
+            key: Optional[Hashable] = None,
+            priority: int = 0,
+            bypass: bool = False,
+            timeout: Optional[float] = None,
+    ) -> Future:
+        """
+        `key`, `priority` and `bypass` are only used with a scheduler, a callable `key` is called
+        on the loop when the submission gets there (ex: the current page, which may be replaced meanwhile).
+
+        With `timeout`, the future is cancelled (and counted in `timed_out`) `timeout` seconds after
+        the submission, waiting in the queue or the scheduler included.
+        """
+        future = Future()
+        if self.metrics is not None or self.tracer is not None:
+            future.operation = name or operation_name(coro)
+            if self.metrics is not None:
+                self.metrics.submitted(future.operation)
+            if self.tracer is not None:
+                self._trace_submit(future)
+        if self.scheduler is not None and not bypass:
+            future.schedule = (key, priority, threading.get_ident())
+        self._queue.append((coro, future, time.perf_counter(), timeout, bypass))
+
+        # NOTE: append before reading the flag, _drain clears the flag before
+        # emptying the queue, so an item is never left behind without a wakeup
+        if not self._wakeup_pending:
+            self._wakeup_pending = True
+            try:
+                self.loop.call_soon_threadsafe(self._drain)
+            except RuntimeError:
+                self._wakeup_pending = False
+                self.cancel_pending()
+                raise
+        return future
+
+    def _drain(self):
+        self._wakeup_pending = False
+        queue = self._queue
+        while queue:
+            item = queue.popleft()
+            coro, future, submitted, timeout, bypass = item
+            if timeout is not None and not future.done():
+                # NOTE: counted from the submission, armed once on the loop
+                remaining = max(0.0, timeout - (time.perf_counter() - submitted))
+                future.timeout_handle = self.loop.call_later(remaining, self._expire, future)
+            if self._paused and not bypass:
+                # NOTE: `resume` dispatches it, bypass submissions (pool, listeners) may be what unblocks the pause
+                self._held.append(item)
+                continue
+            self._dispatch(coro, future, submitted, bypass)
+
+    def _dispatch(self, coro, future: Future, submitted: float, bypass: bool):
+        if future.cancelled():
+            coro.close()
+            if self.metrics is not None:
+                self.metrics.finished(future.operation, None, "cancelled")
+            return
+        if self.scheduler is None or bypass:
+            self._start(coro, future, submitted, bypass)
+            return
+
+        key, priority, caller = future.schedule
+        if callable(key):
+            try:
+                key = key()
+            except Exception as e:
+                # NOTE: fail this submission only, the rest of the queue goes on
+                self._fail(coro, future, e)
+                return
+        self.scheduler.push(Job(coro, future, submitted, key, priority, caller))
+
+    def _fail(self, coro, future: Future, exception: Exception):
+        coro.close()
+        if future.set_running_or_notify_cancel():
+            future.set_exception(exception)
+        if self.metrics is not None:
+            self.metrics.finished(future.operation, None, "error")
+
+    def _start(self, coro, future: Future, submitted: float, bypass: bool = False) -> asyncio.Task:
+        metrics = self.metrics
+        tracer = self.tracer
+        task = self.loop.create_task(coro)
+        if not bypass:
+            # NOTE: `drain` doesn't wait for bypass tasks, ex: a pool acquire waiting for a release
+            self._active.add(task)
+            task.add_done_callback(self._active.discard)
+        task.add_done_callback(functools.partial(self._copy_task_result, future))
+        future.add_done_callback(functools.partial(self._propagate_cancel, task))
+        if metrics is not None:
+            started = time.perf_counter()
+            metrics.started(future.operation, started - submitted)
+            task.add_done_callback(functools.partial(self._record_task, future.operation, started))
+        if tracer is not None:
+            task.add_done_callback(functools.partial(self._trace_task, future, now_us()))
+        return task
+
+    def _start_job(self, job: Job):
+        task = self._start(job.coro, job.future, job.submitted)
+        task.add_done_callback(functools.partial(self._job_done, job))
+
+    def _job_done(self, job: Job, task: asyncio.Task):
+        self.scheduler.done(job)
+
+    def _skip_job(self, job: Job):
+        job.coro.close()
+        if self.metrics is not None:
+            self.metrics.finished(job.future.operation, None, "cancelled")
+
+    def pause(self):
+        # loop thread
+        self._paused = True
+
+    def resume(self):
+        # loop thread
+        self._paused = False
+        held, self._held = self._held, collections.deque()
+        for coro, future, submitted, _, bypass in held:
+            self._dispatch(coro, future, submitted, bypass)
+        self._drain()
+
+    async def drain(self, timeout: Optional[float] = None) -> bool:
+        """Wait for the started tasks (but the current one), False if some are still running after `timeout`."""
+        tasks = self._active - {asyncio.current_task()}
+        if not tasks:
+            return True
+        _, pending = await asyncio.wait(tasks, timeout=timeout)
+        return not pending
+
+    def _record_task(self, name: str, started: float, task: asyncio.Task):
+        if task.cancelled():
+            outcome = "cancelled"
+        elif task.exception() is not None:
+            outcome = "error"
+        else:
+            outcome = "ok"
+        self.metrics.finished(name, time.perf_counter() - started, outcome)
+
+    def _trace_submit(self, future: Future):
+        # caller thread: a short "submit" slice, start of the flow arrow to the loop task
+        tracer = self.tracer
+        future.trace_id = tracer.new_id()
+        future.submitted_us = now_us()
+        tracer.flow_start(future.trace_id, future.submitted_us)
+        tracer.complete("submit " + future.operation, future.submitted_us, now_us())
+
+    def _trace_task(self, future: Future, started: float, task: asyncio.Task):
+        # loop thread: the task itself, end of the flow arrow
+        ended = now_us()
+        future.loop_ended_us = ended
+        outcome = "cancelled" if task.cancelled() else "error" if task.exception() is not None else "ok"
+        self.tracer.complete(future.operation, started, ended, args={
+            "outcome": outcome,
+            "queue_wait_us": started - future.submitted_us,
+        })
+        self.tracer.flow_end(future.trace_id, started)
+
+    def _trace_wait(self, future: Future):
+        # caller thread: blocked from submission until the result is delivered
+        ended = now_us()
+        loop_ended = getattr(future, "loop_ended_us", None)
+        args = {"delivery_us": ended - loop_ended} if loop_ended is not None else None
+        self.tracer.complete("wait " + future.operation, future.submitted_us, ended, args=args)
+
+    def _expire(self, future: Future):
+        # loop thread, `submit(timeout=...)` elapsed
+        if future.cancel():
+            self.timed_out += 1
+            if self.metrics is not None:
+                self.metrics.timed_out(future.operation)
+
+    def _copy_task_result(self, future: Future, task: asyncio.Task):
+        # NOTE: runs on the loop thread when the task is done
+        timeout_handle = getattr(future, "timeout_handle", None)
+        if timeout_handle is not None:
+            timeout_handle.cancel()
+        if task.cancelled():
+            self.cancelled += 1
+            future.cancel()
+            return
+        if future.cancelled() or not future.set_running_or_notify_cancel():
+            return
+
+        exception = task.exception()
+        if exception is None:
+            future.set_result(task.result())
+        else:
+            future.set_exception(exception)
+
+    def _propagate_cancel(self, task: asyncio.Task, future: Future):
+        # NOTE: runs on whichever thread cancelled the future
+        if not future.cancelled() or task.done():
+            return
+        try:
+            self.loop.call_soon_threadsafe(self._cancel_task, task)
+        except RuntimeError:
+            # loop already closed
+            pass
+
+    def _cancel_task(self, task: asyncio.Task):
+        if task.done():
+            return
+        task.cancel()
+        if self.cancel_grace is not None:
+            self.loop.call_later(self.cancel_grace, self._check_leaked, task)
+
+    def _check_leaked(self, task: asyncio.Task):
+        if task.done():
+            return
+        self.leaked += 1
+        Logger.warning("task %r still running %ss after cancellation", task.get_coro(), self.cancel_grace)
+
+    def wait(self, future: Future, timeout: Optional[float] = None):
+        self.running_futures.add(future)
+        try:
+            return future.result(timeout=timeout)
+        except FutureTimeoutError:
+            # NOTE: the caller gives up, don't let the task keep the page busy
+            if not future.cancel() and future.done():
+                # finished right after the timeout
+                return future.result()
+            self.timed_out += 1
+            if self.metrics is not None:
+                self.metrics.timed_out(future.operation)
+            raise
+        finally:
+            self.running_futures.discard(future)
+            if self.tracer is not None and hasattr(future, "trace_id"):
+                self._trace_wait(future)
+
+    async def wait_async(self, future: Future):
+        self.running_futures.add(future)
+        try:
+            return await asyncio.wrap_future(future)
+        finally:
+            self.running_futures.discard(future)
+            if self.tracer is not None and hasattr(future, "trace_id"):
+                self._trace_wait(future)
+
+    def cancel_pending(self):
+        # Submissions that never reached the loop
+        queue = self._queue
+        queue.extendleft(reversed(self._held))
+        self._held.clear()
+        while queue:
+            coro, future, _, _, _ = queue.popleft()
+            coro.close()
+            future.cancel()
+            if self.metrics is not None:
+                self.metrics.finished(future.operation, None, "cancelled")
+        if self.scheduler is not None:
+            for job in self.scheduler.drain():
+                job.coro.close()
+                if job.future.cancel() and self.metrics is not None:
+                    self.metrics.finished(job.future.operation, None, "cancelled")
+
+    def cancel_all(self):
+        for future in tuple(self.running_futures):
+            if not future.done():
+                future.cancel()
@@ -0,0 +1,364 @@
+import asyncio
+import collections
+import logging
+import threading
+from concurrent.futures import Executor
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Callable,
+    List,
+    Literal,
+    Optional,
+    Tuple,
+)
+
+if TYPE_CHECKING:
+    from PlaywrightSafeThread.browser.threadsafe_browser import ThreadsafeBrowser
+
+Logger = logging.getLogger("PlaywrightSafeThread")
+
+OverflowPolicy = Literal["block", "drop_oldest", "coalesce"]
+OVERFLOW_POLICIES = ("block", "drop_oldest", "coalesce")
+
+
+class EventForwarder:
+    """
+    Receive `event` from `emitter` (page, context, ...) on the browser loop and run `handler(payload)`
+    on `executor`, so heavy handlers never run on the loop.
+
+    At most `max_queue` events wait for a worker, then `overflow` decides:
+        - "drop_oldest" (default): the oldest waiting event is dropped
+        - "coalesce": waiting events with the same `coalesce_key(payload)` are replaced by the newest one
+          (default key: all events are the same, only the latest is kept)
+        - "block": the loop side listener waits for room. NOTE: playwright runs every async listener
+          call in its own task, so this only throttles the handler: the events waiting for room are
+          kept as suspended tasks on the loop, memory is not bounded and playwright is not slowed down.
+    """
+
+    def __init__(
+            self,
+            th: "ThreadsafeBrowser",
+            emitter: Any,
+            event: str,
+            handler: Callable[[Any], Any],
+            executor: Optional[Executor] = None,
+            max_queue: int = 1000,
+            overflow: OverflowPolicy = "drop_oldest",
+            coalesce_key: Optional[Callable[[Any], Any]] = None,
+            concurrency: int = 1,
+    ):
+        if overflow not in OVERFLOW_POLICIES:
+            raise TypeError("unsupported overflow policy")
+        if max_queue < 1 or concurrency < 1:
+            raise ValueError("max_queue and concurrency must be >= 1")
+
+        self.th = th
+        self.emitter = emitter
+        self.event = event
+        self.handler = handler
+        self.executor = executor
+        self.max_queue = max_queue
+        self.overflow = overflow
+        self.coalesce_key = coalesce_key or (lambda payload: None)
+        self.concurrency = concurrency
+
+        self.handled = 0
+        self.errors = 0
+        self.dropped = 0
+        self.coalesced = 0
+
+        self._pending = collections.OrderedDict() if overflow == "coalesce" else collections.deque()
+        self._lock = threading.Lock()
+        self._workers = 0
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._closed = False
+        self._listener = self._on_event_blocking if overflow == "block" else self._on_event
+
+    @property
+    def pending(self) -> int:
+        return len(self._pending)
+
+    # Loop side ########################################################################################################
+    async def _register(self):
+        if self.overflow == "block":
+            self._slots = asyncio.Semaphore(self.max_queue)
+        self.emitter.on(self.event, self._listener)
+
+    async def _unregister(self):
+        self.emitter.remove_listener(self.event, self._listener)
+
+    def _on_event(self, payload):
+        if self._closed:
+            return
+        with self._lock:
+            pending = self._pending
+            if self.overflow == "coalesce":
+                key = self.coalesce_key(payload)
+                if key in pending:
+                    self.coalesced += 1
+                elif len(pending) >= self.max_queue:
+                    pending.popitem(last=False)
+                    self.dropped += 1
+                pending[key] = payload
+            else:
+                if len(pending) >= self.max_queue:
+                    pending.popleft()
+                    self.dropped += 1
+                pending.append(payload)
+        self._spawn_worker()
+
+    async def _on_event_blocking(self, payload):
+        if self._closed:
+            return
+        await self._slots.acquire()
+        if self._closed:
+            # NOTE: closed while waiting for room
+            self._slots.release()
+            return
+        with self._lock:
+            self._pending.append(payload)
+        self._spawn_worker()
+
+    # Workers ##########################################################################################################
+    def _spawn_worker(self):
+        with self._lock:
+            if self._workers >= self.concurrency or not self._pending:
+                return
+            self._workers += 1
+        executor = self.executor or self.th._get_callback_executor()
+        try:
+            executor.submit(self._work)
+        except RuntimeError:
+            # executor shut down
+            with self._lock:
+                self._workers -= 1
+
+    def _pop(self):
+        with self._lock:
+            if not self._pending:
+                self._workers -= 1
+                return False, None
+            if self.overflow == "coalesce":
+                return True, self._pending.popitem(last=False)[1]
+            return True, self._pending.popleft()
+
+    def _work(self):
+        while True:
+            found, payload = self._pop()
+            if not found:
+                return
+            try:
+                self.handler(payload)
+                self.handled += 1
+            except Exception:
+                self.errors += 1
+                Logger.exception("event handler %r", self.handler)
+            finally:
+                if self._slots is not None:
+                    try:
+                        self.th.loop.call_soon_threadsafe(self._slots.release)
+                    except RuntimeError:
+                        # loop closed
+                        pass
+
+    # API ##############################################################################################################
+    def start(self):
+        self.th.run_threadsafe(self._register(), bypass_=True)
+        return self
+
+    def close(self):
+        """Stop listening, events already waiting are still handled."""
+        if self._closed:
+            return
+        self._closed = True
+        self.th.run_threadsafe(self._unregister(), bypass_=True)
+
+    async def aclose(self):
+        if self._closed:
+            return
+        self._closed = True
+        await self.th.create_task(self._unregister(), bypass_=True)
+
+
+class EventStream:
+    """
+    Iterate over `event` payloads of `emitter` from any thread (`for x in stream`) or any
+    event loop (`async for x in stream`). Payloads go through a queue of `maxsize` items, when the
+    consumer falls behind the oldest ones are dropped and counted in `dropped`.
+
+    The stream ends once closed (`close()`, or the emitter emits "close"), after the payloads
+    already queued are consumed.
+    """
+
+    def __init__(
+            self,
+            th: "ThreadsafeBrowser",
+            emitter: Any,
+            event: str,
+            predicate: Optional[Callable[[Any], bool]] = None,
+            maxsize: int = 1000,
+    ):
+        if maxsize < 1:
+            raise ValueError("maxsize must be >= 1")
+
+        self.th = th
+        self.emitter = emitter
+        self.event = event
+        self.predicate = predicate
+        self.maxsize = maxsize
+
+        self.received = 0
+        self.dropped = 0
+        self.closed = False
+
+        self._items = collections.deque()
+        self._cond = threading.Condition()
+        # async consumers: (their loop, future set when an item or the end is available)
+        self._waiters: List[Tuple[asyncio.AbstractEventLoop, asyncio.Future]] = []
+        self._registered = False
+
+    @property
+    def pending(self) -> int:
+        return len(self._items)
+
+    # Loop side ########################################################################################################
+    def _register(self):
+        self.emitter.on(self.event, self._on_event)
+        self.emitter.on("close", self._on_close)
+        self._registered = True
+
+    def _unregister(self):
+        if not self._registered:
+            return
+        self._registered = False
+        for event, listener in ((self.event, self._on_event), ("close", self._on_close)):
+            try:
+                self.emitter.remove_listener(event, listener)
+            except KeyError:
+                pass
+
+    async def _register_async(self):
+        self._register()
+
+    async def _unregister_async(self):
+        self._unregister()
+
+    def _on_event(self, payload):
+        if self.predicate is not None:
+            try:
+                if not self.predicate(payload):
+                    return
+            except Exception:
+                Logger.exception("stream predicate %r", self.predicate)
+                return
+        with self._cond:
+            if self.closed:
+                return
+            self.received += 1
+            if len(self._items) >= self.maxsize:
+                self._items.popleft()
+                self.dropped += 1
+            self._items.append(payload)
+            self._cond.notify()
+            waiters, self._waiters = self._waiters, []
+        self._wake(waiters)
+
+    def _on_close(self, *_):
+        self._unregister()
+        self._end()
+
+    # Consumers ########################################################################################################
+    def _end(self):
+        with self._cond:
+            if self.closed:
+                return
+            self.closed = True
+            self._cond.notify_all()
+            waiters, self._waiters = self._waiters, []
+        self._wake(waiters)
+
+    @staticmethod
+    def _wake(waiters):
+        for loop, waiter in waiters:
+            try:
+                loop.call_soon_threadsafe(_set_waiter, waiter)
+            except RuntimeError:
+                # consumer loop closed
+                pass
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self.th.is_same_loop:
+            raise RuntimeError("iterating a stream would block ThreadsafeBrowser loop, use `async for`")
+        with self._cond:
+            self._cond.wait_for(lambda: self._items or self.closed)
+            if self._items:
+                return self._items.popleft()
+        raise StopIteration
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        while True:
+            with self._cond:
+                if self._items:
+                    return self._items.popleft()
+                if self.closed:
+                    raise StopAsyncIteration
+                loop = asyncio.get_running_loop()
+                waiter = loop.create_future()
+                self._waiters.append((loop, waiter))
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                with self._cond:
+                    if (loop, waiter) in self._waiters:
+                        self._waiters.remove((loop, waiter))
+                raise
+
+    # API ##############################################################################################################
+    def start(self):
+        if self.th.is_same_loop:
+            self._register()
+        else:
+            # NOTE: wait for the listener, events emitted after `stream()` returns are not missed
+            self.th.run_threadsafe(self._register_async(), bypass_=True)
+        return self
+
+    def close(self):
+        """Stop listening and end the iterators, payloads already queued are still delivered."""
+        if self.closed:
+            return
+        if self.th.is_same_loop:
+            self._unregister()
+        elif self.th.thread.is_alive():
+            self.th.run_threadsafe(self._unregister_async(), bypass_=True)
+        self._end()
+
+    async def aclose(self):
+        if self.closed:
+            return
+        if self.th.thread.is_alive():
+            await self.th.create_task(self._unregister_async(), bypass_=True)
+        self._end()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.aclose()
+
+
+def _set_waiter(waiter: asyncio.Future):
+    if not waiter.done():
+        waiter.set_result(None)
@@ -0,0 +1,418 @@
+import asyncio
+import contextlib
+import email.utils
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from typing import (
+    Dict,
+    Iterable,
+    List,
+    Optional,
+    Tuple,
+)
+
+from PlaywrightSafeThread.browser.install_cache import CACHE_DIR
+
+Logger = logging.getLogger("PlaywrightSafeThread")
+
+HTTP_CACHE_DIR = os.path.join(CACHE_DIR, "http_cache")
+CACHEABLE_TYPES = ("script", "stylesheet", "font", "image")
+# NOTE: the body handed to `route.fulfill` is already decoded
+DROPPED_HEADERS = frozenset(("content-encoding", "content-length", "transfer-encoding", "connection", "set-cookie"))
+# blobs younger than this are not garbage collected, their entry may still be on its way
+BLOB_GRACE = 60.0
+# NOTE: bodies are stored decoded, a variant fits whatever encoding the request accepts
+VARY_IGNORED = frozenset(("accept-encoding",))
+# a response to a request with `Authorization` is only stored by a shared cache with one of these (RFC 9111 3.5)
+AUTHORIZED_STORABLE = frozenset(("public", "must-revalidate", "s-maxage"))
+
+
+def parse_cache_control(value: str) -> Dict[str, Optional[str]]:
+    directives = {}
+    for part in value.split(","):
+        name, _, arg = part.strip().partition("=")
+        if name:
+            directives[name.lower()] = arg.strip('"') if arg else None
+    return directives
+
+
+def _http_date(value: Optional[str]) -> Optional[float]:
+    if not value:
+        return None
+    try:
+        return email.utils.parsedate_to_datetime(value).timestamp()
+    except (TypeError, ValueError, IndexError, OverflowError):
+        return None
+
+
+def freshness_lifetime(headers: Dict[str, str], now: float, heuristic_max: float) -> Optional[float]:
+    """Seconds a response stays fresh in a shared cache (RFC 9111), `None` when it must not be stored."""
+    directives = parse_cache_control(headers.get("cache-control", ""))
+    if "no-store" in directives or "private" in directives:
+        return None
+    if "no-cache" in directives:
+        return 0.0
+    for name in ("s-maxage", "max-age"):
+        if (directives.get(name) or "").isdigit():
+            return float(directives[name])
+    date = _http_date(headers.get("date")) or now
+    expires = headers.get("expires")
+    if expires is not None:
+        expires_at = _http_date(expires)
+        return max(0.0, expires_at - date) if expires_at is not None else 0.0
+    last_modified = _http_date(headers.get("last-modified"))
+    if last_modified is not None:
+        # heuristic freshness: 10% of the time since the last modification
+        return min(max(0.0, (date - last_modified) / 10), heuristic_max)
+    return 0.0
+
+
+def current_age(headers: Dict[str, str], now: float) -> float:
+    """Seconds the response already spent in upstream caches and on the way (RFC 9111 4.2.3)."""
+    date = _http_date(headers.get("date"))
+    age = headers.get("age", "").strip()
+    return max(0.0, now - date if date is not None else 0.0, float(age) if age.isdigit() else 0.0)
+
+
+def vary_names(vary: str) -> List[str]:
+    return [name for name in (part.strip().lower() for part in vary.split(",")) if name and name not in VARY_IGNORED]
+
+
+def write_atomic(path: str, data: bytes):
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=directory, prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+    except BaseException:
+        with contextlib.suppress(OSError):
+            os.remove(tmp)
+        raise
+
+
+class HttpCache:
+    """
+    On disk HTTP cache shared by every context, browser and process using the same `path`, requests
+    are served through `context.route`.
+
+    Bodies are stored once by content hash (blobs/), responses are indexed by method and url
+    (entries/), each entry holding one variant per value of the request headers named in `Vary`.
+    Only `methods` requests of `resource_types` with a 200 response are stored, `Cache-Control` and
+    `Expires` decide for how long they are served without the network, stale ones having an
+    `ETag` or `Last-Modified` are revalidated with a conditional request. Like any shared cache,
+    `private` responses and answers to `Authorization` requests (unless `public`) are not stored,
+    nor responses varying on a header the request doesn't show (`Vary: Cookie`).
+
+    Past `max_size` bytes of bodies, the least recently used entries are evicted.
+    Disk access runs on the default executor, not on the browser loop.
+    """
+
+    def __init__(
+            self,
+            path: str = HTTP_CACHE_DIR,
+            max_size: int = 512 * 1024 ** 2,
+            resource_types: Iterable[str] = CACHEABLE_TYPES,
+            methods: Iterable[str] = ("GET",),
+            heuristic_max_age: float = 24 * 3600.0,
+    ):
+        self.path = path
+        self.max_size = max_size
+        self.resource_types = frozenset(resource_types)
+        self.methods = frozenset(method.upper() for method in methods)
+        self.heuristic_max_age = heuristic_max_age
+
+        self.hits = 0
+        self.misses = 0
+        self.revalidated = 0
+        self.stored = 0
+        self.evicted = 0
+
+        self._lock = threading.Lock()
+        # NOTE: size of the bodies at the last scan (`evict`) plus what this process stored since
+        self._size: Optional[int] = None
+        self._evicting = False
+
+    # Disk #############################################################################################################
+    @staticmethod
+    def key(method: str, url: str) -> str:
+        return hashlib.sha256(("%s %s" % (method, url)).encode("utf-8")).hexdigest()
+
+    def _entry_path(self, key: str) -> str:
+        return os.path.join(self.path, "entries", key[:2], key + ".json")
+
+    def _blob_path(self, digest: str) -> str:
+        return os.path.join(self.path, "blobs", digest[:2], digest)
+
+    def _read_entry(self, key: str) -> Optional[dict]:
+        try:
+            with open(self._entry_path(key), encoding="utf-8") as f:
+                entry = json.load(f)
+            return entry if isinstance(entry, dict) else None
+        except (OSError, ValueError):
+            return None
+
+    def _write_entry(self, key: str, entry: dict):
+        write_atomic(self._entry_path(key), json.dumps(entry).encode("utf-8"))
+
+    @staticmethod
+    def _variant_of(entry: Optional[dict], request_headers: Dict[str, str]) -> Tuple[int, Optional[dict]]:
+        if entry is None:
+            return -1, None
+        for index, variant in enumerate(entry.get("variants", ())):
+            # NOTE: a header the variant was stored without never matches, see `store`
+            if all(value is not None and request_headers.get(name) == value
+                   for name, value in variant["vary"].items()):
+                return index, variant
+        return -1, None
+
+    def lookup(self, method: str, url: str, request_headers: Dict[str, str]) -> Tuple[Optional[dict], Optional[bytes]]:
+        """Variant matching the request and its body."""
+        key = self.key(method, url)
+        _, variant = self._variant_of(self._read_entry(key), request_headers)
+        if variant is None:
+            return None, None
+        try:
+            with open(self._blob_path(variant["blob"]), "rb") as f:
+                body = f.read()
+        except OSError:
+            # evicted by another process
+            return None, None
+        with contextlib.suppress(OSError):
+            # NOTE: the entry mtime is its last use, for the LRU eviction
+            os.utime(self._entry_path(key))
+        return variant, body
+
+    def store(self, method: str, url: str, request_headers: Dict[str, str], response_headers: Dict[str, str],
+              status: int, body: bytes) -> bool:
+        now = time.time()
+        vary = response_headers.get("vary", "")
+        if vary.strip() == "*":
+            return False
+        vary = vary_names(vary)
+        if any(name not in request_headers for name in vary):
+            # NOTE: `request.headers` leaves cookies and other security related headers out, a variant
+            # stored without them would match any request: one account's response served to the others
+            return False
+        lifetime = freshness_lifetime(response_headers, now, self.heuristic_max_age)
+        if lifetime is None:
+            return False
+        if request_headers.get("authorization") and not (
+                AUTHORIZED_STORABLE & parse_cache_control(response_headers.get("cache-control", "")).keys()):
+            # NOTE: shared with other contexts and processes, one account's response must not reach another
+            return False
+        etag = response_headers.get("etag")
+        last_modified = response_headers.get("last-modified")
+        expires = now + lifetime - current_age(response_headers, now)
+        if expires <= now and not etag and not last_modified:
+            # never fresh and can't be revalidated
+            return False
+
+        digest = hashlib.sha256(body).hexdigest()
+        blob = self._blob_path(digest)
+        if not os.path.exists(blob):
+            write_atomic(blob, body)
+            with self._lock:
+                if self._size is not None:
+                    self._size += len(body)
+
+        variant = {
+            "vary": {name: request_headers[name] for name in vary},
+            "status": status,
+            "headers": {name: value for name, value in response_headers.items() if name not in DROPPED_HEADERS},
+            "blob": digest,
+            "size": len(body),
+            "stored": now,
+            "expires": expires,
+            "etag": etag,
+            "last_modified": last_modified,
+        }
+        key = self.key(method, url)
+        entry = self._read_entry(key) or {"method": method, "url": url, "variants": []}
+        index, _ = self._variant_of(entry, request_headers)
+        if index >= 0:
+            entry["variants"][index] = variant
+        else:
+            entry["variants"].append(variant)
+        self._write_entry(key, entry)
+        self.stored += 1
+        self._maybe_evict()
+        return True
+
+    def refresh(self, method: str, url: str, request_headers: Dict[str, str], response_headers: Dict[str, str]):
+        """A 304 answered a revalidation: the stored variant is fresh again."""
+        key = self.key(method, url)
+        entry = self._read_entry(key)
+        index, variant = self._variant_of(entry, request_headers)
+        if variant is None:
+            return
+        now = time.time()
+        headers = dict(variant["headers"])
+        headers.update((name, value) for name, value in response_headers.items() if name not in DROPPED_HEADERS)
+        lifetime = freshness_lifetime(headers, now, self.heuristic_max_age) or 0.0
+        variant.update(headers=headers, stored=now, expires=now + lifetime - current_age(response_headers, now))
+        entry["variants"][index] = variant
+        self._write_entry(key, entry)
+
+    # Eviction #########################################################################################################
+    def _maybe_evict(self):
+        with self._lock:
+            if self._evicting or (self._size is not None and self._size <= self.max_size):
+                return
+            self._evicting = True
+        try:
+            self.evict()
+        finally:
+            self._evicting = False
+
+    def _scan(self) -> Tuple[List[Tuple[float, str, List[str]]], Dict[str, Tuple[int, float]]]:
+        entries = []
+        for directory, _, files in os.walk(os.path.join(self.path, "entries")):
+            for name in files:
+                if not name.endswith(".json"):
+                    continue
+                path = os.path.join(directory, name)
+                try:
+                    used = os.path.getmtime(path)
+                    with open(path, encoding="utf-8") as f:
+                        blobs = [variant["blob"] for variant in json.load(f).get("variants", ())]
+                except (OSError, ValueError, KeyError, AttributeError):
+                    continue
+                entries.append((used, path, blobs))
+        blobs = {}
+        for directory, _, files in os.walk(os.path.join(self.path, "blobs")):
+            for name in files:
+                try:
+                    stat = os.stat(os.path.join(directory, name))
+                except OSError:
+                    continue
+                blobs[name] = (stat.st_size, stat.st_mtime)
+        return entries, blobs
+
+    def evict(self, target: Optional[int] = None):
+        """Remove the least recently used entries until the bodies take less than `target` (90% of max_size)."""
+        target = int(self.max_size * 0.9) if target is None else target
+        entries, blobs = self._scan()
+        entries.sort()
+
+        refs: Dict[str, int] = {}
+        for _, _, entry_blobs in entries:
+            for digest in set(entry_blobs):
+                refs[digest] = refs.get(digest, 0) + 1
+        size = sum(size for digest, (size, _) in blobs.items() if digest in refs)
+
+        for _, path, entry_blobs in entries:
+            if size <= target:
+                break
+            with contextlib.suppress(OSError):
+                os.remove(path)
+                self.evicted += 1
+            for digest in set(entry_blobs):
+                refs[digest] -= 1
+                if not refs[digest] and digest in blobs:
+                    size -= blobs[digest][0]
+
+        now = time.time()
+        for digest, (_, mtime) in blobs.items():
+            if not refs.get(digest) and now - mtime >= BLOB_GRACE:
+                with contextlib.suppress(OSError):
+                    os.remove(self._blob_path(digest))
+        with self._lock:
+            self._size = size
+
+    def clear(self):
+        self.evict(target=-1)
+
+    # Loop side ########################################################################################################
+    async def install(self, context):
+        await context.route("**/*", self._handle)
+
+    def _fresh(self, variant: dict, request_headers: Dict[str, str]) -> bool:
+        directives = parse_cache_control(request_headers.get("cache-control", ""))
+        if "no-cache" in directives or directives.get("max-age") == "0":
+            return False
+        return time.time() < variant["expires"]
+
+    async def _handle(self, route):
+        request = route.request
+        method = request.method
+        if method not in self.methods or request.resource_type not in self.resource_types:
+            await route.fallback()
+            return
+        request_headers = request.headers
+        if "no-store" in parse_cache_control(request_headers.get("cache-control", "")):
+            await route.fallback()
+            return
+
+        loop = asyncio.get_running_loop()
+        url = request.url
+        try:
+            variant, body = await loop.run_in_executor(None, self.lookup, method, url, request_headers)
+        except Exception:
+            Logger.exception("http cache lookup %s", url)
+            variant, body = None, None
+
+        if variant is not None and self._fresh(variant, request_headers):
+            self.hits += 1
+            await route.fulfill(status=variant["status"], headers=variant["headers"], body=body)
+            return
+
+        conditional = {}
+        if variant is not None:
+            if variant["etag"]:
+                conditional["if-none-match"] = variant["etag"]
+            if variant["last_modified"]:
+                conditional["if-modified-since"] = variant["last_modified"]
+        try:
+            if conditional:
+                response = await route.fetch(headers=dict(request_headers, **conditional))
+            else:
+                response = await route.fetch()
+        except Exception as e:
+            # NOTE: let the browser report the network error
+            Logger.debug("http cache fetch %s: %r", url, e)
+            await route.fallback()
+            return
+
+        response_headers = response.headers
+        if response.status == 304 and variant is not None:
+            self.revalidated += 1
+            await route.fulfill(status=variant["status"], headers=variant["headers"], body=body)
+            future = loop.run_in_executor(None, self.refresh, method, url, request_headers, response_headers)
+            future.add_done_callback(self._log_store_error)
+            return
+
+        self.misses += 1
+        body = await response.body()
+        await route.fulfill(response=response, body=body)
+        if response.status == 200:
+            if "authorization" not in request_headers:
+                # NOTE: `request.headers` leaves the security related headers out
+                authorization = await request.header_value("authorization")
+                if authorization is not None:
+                    request_headers = dict(request_headers, authorization=authorization)
+            future = loop.run_in_executor(
+                None, self.store, method, url, request_headers, response_headers, response.status, body
+            )
+            future.add_done_callback(self._log_store_error)
+
+    @staticmethod
+    def _log_store_error(future: asyncio.Future):
+        if not future.cancelled() and future.exception() is not None:
+            Logger.error("http cache store", exc_info=future.exception())
+
+    def snapshot(self) -> dict:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "revalidated": self.revalidated,
+            "stored": self.stored,
+            "evicted": self.evicted,
+            "size": self._size,
+        }
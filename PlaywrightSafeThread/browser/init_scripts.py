@@ -0,0 +1,64 @@
+from typing import (
+    Iterable,
+    List,
+    Optional,
+    Tuple,
+)
+
+
+def stealth_script() -> str:
+    """Every evasion of playwright-stealth as one script (2.x `Stealth().script_payload`, 1.x `StealthConfig`)."""
+    try:
+        from playwright_stealth import Stealth
+    except ImportError:
+        from playwright_stealth.stealth import StealthConfig
+
+        return ";\n".join(StealthConfig().enabled_scripts)
+    return Stealth().script_payload
+
+
+class InitScripts:
+    """
+    Scripts run in every page before its own scripts, installed once per context
+    (`context.add_init_script`) as a single script instead of page by page.
+
+    NOTE: the scripts share the page global scope like separate init scripts do, an
+    exception thrown by one stops the ones after it.
+    """
+
+    def __init__(self, scripts: Iterable[str] = (), stealth: bool = False):
+        self._scripts: List[Tuple[str, str]] = []
+        self._payload: Optional[str] = None
+        if stealth:
+            self.add(stealth_script(), name="stealth")
+        for script in scripts:
+            self.add(script)
+
+    def __len__(self):
+        return len(self._scripts)
+
+    @property
+    def names(self) -> List[str]:
+        return [name for name, _ in self._scripts]
+
+    def add(self, script: Optional[str] = None, path: Optional[str] = None, name: Optional[str] = None) -> str:
+        """Register a script (or the content of `path`) for the contexts created from now on, returns it."""
+        if script is None:
+            if path is None:
+                raise TypeError("script or path is required")
+            with open(path, encoding="utf-8") as f:
+                script = f.read()
+        name = name or path or "script-%i" % len(self._scripts)
+        self._scripts.append((name, script))
+        self._payload = None
+        return script
+
+    @property
+    def payload(self) -> str:
+        if self._payload is None:
+            self._payload = ";\n".join(script for _, script in self._scripts)
+        return self._payload
+
+    async def install(self, context):
+        if self._scripts:
+            await context.add_init_script(self.payload)
@@ -0,0 +1,108 @@
+import contextlib
+import hashlib
+import json
+import os
+import tempfile
+from typing import (
+    Dict,
+    Optional,
+)
+
+CACHE_DIR = os.path.join(tempfile.gettempdir(), "PlaywrightSafeThread")
+CACHE_FILE = os.path.join(CACHE_DIR, "install_cache.json")
+
+
+def driver_version() -> str:
+    try:
+        from playwright._repo_version import version
+        return version
+    except ImportError:
+        from importlib.metadata import version
+        return version("playwright")
+
+
+def cache_key(browser: str, env: Dict[str, str]) -> str:
+    return "|".join((driver_version(), browser, env.get("PLAYWRIGHT_BROWSERS_PATH", "")))
+
+
+def _read() -> Dict[str, str]:
+    try:
+        with open(CACHE_FILE, encoding="utf-8") as f:
+            data = json.load(f)
+        return data if isinstance(data, dict) else {}
+    except (OSError, ValueError):
+        return {}
+
+
+def _write(data: Dict[str, str]):
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=CACHE_DIR, prefix=".install_cache-", suffix=".json")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+        os.replace(tmp, CACHE_FILE)
+    except BaseException:
+        with contextlib.suppress(OSError):
+            os.remove(tmp)
+        raise
+
+
+def lookup(key: str) -> Optional[str]:
+    """Return the cached install location, only if it still exists on disk."""
+    location = _read().get(key)
+    if location and os.path.exists(location):
+        return location
+    return None
+
+
+def store(key: str, location: str):
+    with file_lock(CACHE_FILE + ".lock"):
+        data = _read()
+        data[key] = location
+        _write(data)
+
+
+def invalidate(key: Optional[str] = None):
+    """Forget `key`, or every cached install location when `key` is None."""
+    with file_lock(CACHE_FILE + ".lock"):
+        data = _read()
+        if key is None:
+            data.clear()
+        else:
+            data.pop(key, None)
+        _write(data)
+
+
+def install_lock(env: Dict[str, str]):
+    # NOTE: processes sharing the same PLAYWRIGHT_BROWSERS_PATH must not install at the same time
+    browsers_path = env.get("PLAYWRIGHT_BROWSERS_PATH", "")
+    digest = hashlib.sha1(browsers_path.encode("utf-8")).hexdigest()[:16]
+    return file_lock(os.path.join(CACHE_DIR, "install-%s.lock" % digest))
+
+
+@contextlib.contextmanager
+def file_lock(path: str):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "a+b") as f:
+        if os.name == "nt":
+            import msvcrt
+            f.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    # LK_LOCK gives up after 10 seconds, keep waiting
+                    continue
+            try:
+                yield
+            finally:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            import fcntl
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
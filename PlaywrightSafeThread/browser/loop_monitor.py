@@ -0,0 +1,219 @@
+import asyncio
+import collections
+import logging
+import sys
+import threading
+import time
+import traceback
+from typing import (
+    Deque,
+    List,
+    Optional,
+)
+
+from PlaywrightSafeThread.browser.metrics import DEFAULT_BUCKETS, Histogram
+
+Logger = logging.getLogger("PlaywrightSafeThread")
+
+
+class SlowCallback:
+    __slots__ = ("started", "duration", "origin", "stack")
+
+    def __init__(self, started: float, duration: float, origin: str, stack: List[str]):
+        # NOTE: `started` is a wall clock timestamp (time.time)
+        self.started = started
+        self.duration = duration
+        self.origin = origin
+        self.stack = stack
+
+    def as_dict(self) -> dict:
+        return {"started": self.started, "duration": self.duration, "origin": self.origin, "stack": self.stack}
+
+    def __repr__(self):
+        return "<SlowCallback %.3fs %s>" % (self.duration, self.origin)
+
+
+def _describe(callback) -> str:
+    # ex: "Task main.<locals>.job", "Dispatcher._drain"
+    owner = getattr(callback, "__self__", None)
+    if isinstance(owner, asyncio.Task):
+        coro = owner.get_coro()
+        return "Task " + (getattr(coro, "__qualname__", None) or repr(coro))
+    return getattr(callback, "__qualname__", None) or repr(callback)
+
+
+class LoopMonitor:
+    """
+    Time every callback of an event loop and measure its lag.
+
+    Callbacks scheduled on the loop after `start` (`call_soon`, `call_soon_threadsafe`, `call_at`,
+    `call_later`: task steps, future callbacks, timers) are timed as they run. Those taking
+    `threshold` seconds or more are logged and kept in `slow_callbacks` (the last `max_records`).
+    A watchdog thread captures the loop thread stack of a callback still running after
+    `threshold`, the record then points at the blocking line instead of the callback.
+
+    NOTE: callbacks scheduled before `start` or added by the loop itself (selector readers and
+    writers of transports) are not timed, their time only shows in the lag. A callback returning
+    before the watchdog next looks (every `threshold / 2` seconds) is recorded without stack.
+    Timing adds about a microsecond per callback.
+
+    Every `interval` seconds a heartbeat is scheduled with `call_soon_threadsafe`, the time it
+    takes to run is the loop lag.
+    """
+
+    def __init__(
+            self,
+            loop: asyncio.AbstractEventLoop,
+            interval: float = 0.5,
+            threshold: float = 0.1,
+            max_records: int = 100,
+            prefix: str = "playwright_safe_thread",
+    ):
+        self.loop = loop
+        self.interval = interval
+        self.threshold = threshold
+        self.prefix = prefix
+
+        self.lag = Histogram(DEFAULT_BUCKETS)
+        self.last_lag: Optional[float] = None
+        self.max_lag = 0.0
+        self.slow_callbacks: Deque[SlowCallback] = collections.deque(maxlen=max_records)
+
+        self._thread_id: Optional[int] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        # (started, stack) of the callback running on the loop, stack taken by the watchdog
+        self._running: Optional[list] = None
+        self._beat_pending = False
+
+    def start(self, thread_id: int):
+        # NOTE: from the loop thread, before the loop runs
+        self._thread_id = thread_id
+        self._stop.clear()
+        self._instrument()
+        self._thread = threading.Thread(
+            name="Thread-browser-monitor-%i" % id(self), target=self._run, daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._restore()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join()
+
+    # Loop side ########################################################################################################
+    def _instrument(self):
+        # NOTE: instance attributes shadow the loop methods, other loops are not affected
+        loop = self.loop
+        call_soon, call_soon_threadsafe, call_at = loop.call_soon, loop.call_soon_threadsafe, loop.call_at
+        timed = self._timed
+
+        def _call_soon(callback, *args, context=None):
+            return call_soon(timed(callback), *args, context=context)
+
+        def _call_soon_threadsafe(callback, *args, context=None):
+            return call_soon_threadsafe(timed(callback), *args, context=context)
+
+        def _call_at(when, callback, *args, context=None):
+            # NOTE: `call_later` goes through `call_at`
+            return call_at(when, timed(callback), *args, context=context)
+
+        loop.call_soon = _call_soon
+        loop.call_soon_threadsafe = _call_soon_threadsafe
+        loop.call_at = _call_at
+
+    def _restore(self):
+        for name in ("call_soon", "call_soon_threadsafe", "call_at"):
+            self.loop.__dict__.pop(name, None)
+
+    def _timed(self, callback):
+        def _run(*args):
+            running = self._running = [time.perf_counter(), None]
+            try:
+                return callback(*args)
+            finally:
+                self._running = None
+                duration = time.perf_counter() - running[0]
+                if duration >= self.threshold:
+                    self._slow(callback, running[0], duration, running[1])
+
+        return _run
+
+    def _slow(self, callback, started: float, duration: float, stack: Optional[List[str]]):
+        if stack:
+            origin = stack[-1].strip().splitlines()[0]
+        else:
+            origin = _describe(callback)
+        # `started` as a wall clock timestamp
+        record = SlowCallback(time.time() - (time.perf_counter() - started), duration, origin, stack or [])
+        with self._lock:
+            self.slow_callbacks.append(record)
+        Logger.warning("browser loop blocked for %.3fs by %s\n%s", duration, origin, "".join(stack or ()))
+
+    def _beat(self, sent: float):
+        self._beat_pending = False
+        self._observe(time.perf_counter() - sent)
+
+    # Watchdog #########################################################################################################
+    def _run(self):
+        tick = min(self.interval, self.threshold / 2)
+        next_beat = time.perf_counter()
+        while not self._stop.wait(tick):
+            now = time.perf_counter()
+            running = self._running
+            if running is not None and running[1] is None and now - running[0] >= self.threshold:
+                # NOTE: the loop is blocked right now, the loop thread stack shows by what
+                stack = self._loop_stack()
+                if self._running is running:
+                    running[1] = stack
+
+            if now >= next_beat and not self._beat_pending:
+                next_beat = now + self.interval
+                self._beat_pending = True
+                try:
+                    self.loop.call_soon_threadsafe(self._beat, now)
+                except RuntimeError:
+                    # loop closed
+                    return
+
+    def _loop_stack(self) -> List[str]:
+        frame = sys._current_frames().get(self._thread_id)
+        if frame is None:
+            return []
+        return traceback.format_stack(frame)
+
+    def _observe(self, lag: float):
+        with self._lock:
+            self.lag.observe(lag)
+            self.last_lag = lag
+            self.max_lag = max(self.max_lag, lag)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "last_lag": self.last_lag,
+                "max_lag": self.max_lag,
+                "lag": self.lag.snapshot(),
+                "slow_callbacks": [record.as_dict() for record in self.slow_callbacks],
+            }
+
+    def to_prometheus(self) -> str:
+        prefix = self.prefix
+        with self._lock:
+            lines = [
+                "# HELP %s_loop_lag_seconds Delay before a heartbeat runs on the browser loop." % prefix,
+                "# TYPE %s_loop_lag_seconds histogram" % prefix,
+            ]
+            cumulative = 0
+            for bound, count in zip(self.lag.buckets + (float("inf"),), self.lag.counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append('%s_loop_lag_seconds_bucket{le="%s"} %i' % (prefix, le, cumulative))
+            lines.append("%s_loop_lag_seconds_sum %r" % (prefix, self.lag.sum))
+            lines.append("%s_loop_lag_seconds_count %i" % (prefix, self.lag.count))
+            lines.append("# HELP %s_loop_max_lag_seconds Highest loop lag seen." % prefix)
+            lines.append("# TYPE %s_loop_max_lag_seconds gauge" % prefix)
+            lines.append("%s_loop_max_lag_seconds %r" % (prefix, self.max_lag))
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,164 @@
+import bisect
+import threading
+from typing import (
+    Dict,
+    Optional,
+    Sequence,
+)
+
+# seconds
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+OUTCOMES = ("ok", "error", "cancelled", "timeout")
+
+
+def operation_name(coro) -> str:
+    # ex: "Page.goto", "Page.evaluate", "main.<locals>.job"
+    return getattr(coro, "__qualname__", None) or type(coro).__name__
+
+
+class Histogram:
+    __slots__ = ("buckets", "counts", "count", "sum")
+
+    def __init__(self, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q: float) -> Optional[float]:
+        # upper bound of the bucket holding the q-quantile
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+    def snapshot(self) -> dict:
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "p50": self.quantile(0.5),
+            "p99": self.quantile(0.99),
+            "buckets": dict(zip(self.buckets + (float("inf"),), self.counts)),
+        }
+
+
+class OperationStats:
+    __slots__ = ("queue_wait", "execution", "outcomes", "in_flight")
+
+    def __init__(self, buckets: Sequence[float]):
+        self.queue_wait = Histogram(buckets)
+        self.execution = Histogram(buckets)
+        self.outcomes = dict.fromkeys(OUTCOMES, 0)
+        self.in_flight = 0
+
+
+class DispatchMetrics:
+    """
+    Per operation (coroutine qualname) statistics of the dispatch layer:
+    queue wait (submit -> start on the loop), execution time, outcome counters
+    and number of calls in flight.
+    """
+
+    def __init__(self, buckets: Sequence[float] = DEFAULT_BUCKETS, prefix: str = "playwright_safe_thread"):
+        self.buckets = tuple(buckets)
+        self.prefix = prefix
+        self._operations: Dict[str, OperationStats] = {}
+        self._lock = threading.Lock()
+
+    def _stats(self, name: str) -> OperationStats:
+        stats = self._operations.get(name)
+        if stats is None:
+            stats = self._operations[name] = OperationStats(self.buckets)
+        return stats
+
+    def submitted(self, name: str):
+        with self._lock:
+            self._stats(name).in_flight += 1
+
+    def started(self, name: str, queue_wait: float):
+        with self._lock:
+            self._stats(name).queue_wait.observe(queue_wait)
+
+    def finished(self, name: str, execution: Optional[float], outcome: str):
+        with self._lock:
+            stats = self._stats(name)
+            stats.in_flight -= 1
+            stats.outcomes[outcome] += 1
+            if execution is not None:
+                stats.execution.observe(execution)
+
+    def timed_out(self, name: str):
+        # NOTE: the task itself is then cancelled and reported by `finished`
+        with self._lock:
+            self._stats(name).outcomes["timeout"] += 1
+
+    @property
+    def in_flight(self) -> int:
+        return sum(stats.in_flight for stats in list(self._operations.values()))
+
+    def reset(self):
+        with self._lock:
+            self._operations.clear()
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                name: {
+                    "in_flight": stats.in_flight,
+                    "outcomes": dict(stats.outcomes),
+                    "queue_wait": stats.queue_wait.snapshot(),
+                    "execution": stats.execution.snapshot(),
+                }
+                for name, stats in self._operations.items()
+            }
+
+    def to_prometheus(self) -> str:
+        """Prometheus text exposition format."""
+        prefix = self.prefix
+        lines = []
+        with self._lock:
+            operations = sorted(self._operations.items())
+
+            lines.append("# HELP %s_in_flight Calls submitted and not finished yet." % prefix)
+            lines.append("# TYPE %s_in_flight gauge" % prefix)
+            for name, stats in operations:
+                lines.append('%s_in_flight{operation="%s"} %i' % (prefix, _escape(name), stats.in_flight))
+
+            lines.append("# HELP %s_calls_total Calls by outcome, a timed out call is also counted as cancelled once its task stops." % prefix)
+            lines.append("# TYPE %s_calls_total counter" % prefix)
+            for name, stats in operations:
+                for outcome, count in stats.outcomes.items():
+                    lines.append('%s_calls_total{operation="%s",outcome="%s"} %i' % (
+                        prefix, _escape(name), outcome, count))
+
+            for metric, attribute, doc in (
+                    ("queue_wait_seconds", "queue_wait", "Time from submission to start on the browser loop."),
+                    ("execution_seconds", "execution", "Time spent running on the browser loop."),
+            ):
+                lines.append("# HELP %s_%s %s" % (prefix, metric, doc))
+                lines.append("# TYPE %s_%s histogram" % (prefix, metric))
+                for name, stats in operations:
+                    histogram = getattr(stats, attribute)
+                    label = _escape(name)
+                    cumulative = 0
+                    for bound, count in zip(histogram.buckets + (float("inf"),), histogram.counts):
+                        cumulative += count
+                        le = "+Inf" if bound == float("inf") else repr(bound)
+                        lines.append('%s_%s_bucket{operation="%s",le="%s"} %i' % (prefix, metric, label, le, cumulative))
+                    lines.append('%s_%s_sum{operation="%s"} %r' % (prefix, metric, label, histogram.sum))
+                    lines.append('%s_%s_count{operation="%s"} %i' % (prefix, metric, label, histogram.count))
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
@@ -0,0 +1,309 @@
+import asyncio
+import collections
+import contextlib
+from typing import (
+    TYPE_CHECKING,
+    Deque,
+    Dict,
+    List,
+    Optional,
+    Set,
+)
+
+if TYPE_CHECKING:
+    from playwright.async_api import BrowserContext, Page
+    from PlaywrightSafeThread.browser.threadsafe_browser import ThreadsafeBrowser
+
+
+class PoolExhausted(Exception):
+    pass
+
+
+class _PoolEntry:
+    __slots__ = ("page", "context", "baseline_listeners")
+
+    def __init__(self, page: "Page", context: "BrowserContext", baseline_listeners: Dict[str, list]):
+        self.page = page
+        self.context = context
+        # NOTE: playwright registers its own listeners on the page (close, crash),
+        # we keep them on reset and only drop the ones added by the borrower
+        self.baseline_listeners = baseline_listeners
+
+
+class PagePool:
+    """
+    Bounded pool of pages (or isolated contexts) owned by a ThreadsafeBrowser.
+
+    Pages are created on the browser loop, handed out with `acquire`/`acquire_sync`
+    and reset (about:blank, routes, listeners, optionally cookies) when given back
+    with `release`/`release_sync`. When every page is checked out, `acquire` waits
+    up to `timeout` seconds, or raises `PoolExhausted` right away with `block=False`.
+    A page given back closed or broken is dropped, a waiting `acquire` creates a new one.
+    """
+
+    def __init__(
+            self,
+            th: "ThreadsafeBrowser",
+            max_size: int = 4,
+            isolated: bool = False,
+            clear_cookies: bool = False,
+            block: bool = True,
+            timeout: Optional[float] = None,
+            **context_option
+    ):
+        if max_size < 1:
+            raise ValueError("max_size must be >= 1")
+        if clear_cookies and not isolated:
+            # NOTE: pages of a non isolated pool share `th.context`, clearing its cookies
+            # would log out `th.page` and every page other threads still hold
+            raise ValueError("clear_cookies needs isolated=True")
+
+        self.th = th
+        self.max_size = max_size
+        self.isolated = isolated
+        self.clear_cookies = clear_cookies
+        self.block = block
+        self.timeout = timeout
+        self._context_option = context_option
+
+        self._created = 0
+        self._closed = False
+        self._idle: Deque[_PoolEntry] = collections.deque()
+        self._waiters: Deque[asyncio.Future] = collections.deque()
+        self._in_use: Dict["Page", _PoolEntry] = {}
+        self._entries: Set[_PoolEntry] = set()
+        th._pools.add(self)
+
+    @property
+    def size(self) -> int:
+        return self._created
+
+    @property
+    def in_use(self) -> int:
+        return len(self._in_use)
+
+    @property
+    def idle(self) -> int:
+        return len(self._idle)
+
+    # Loop side ########################################################################################################
+    def _wake(self):
+        # NOTE: a page was given back or there is room for a new one, one waiter takes it
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+
+    async def _wait(self, timeout: Optional[float]):
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await asyncio.wait_for(waiter, timeout)
+        except BaseException:
+            if waiter.done() and not waiter.cancelled():
+                # woken up but timed out (or cancelled) meanwhile, hand the wakeup over
+                self._wake()
+            raise
+        finally:
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+
+    async def _new_entry(self) -> _PoolEntry:
+        if self.isolated:
+            browser = getattr(self.th, "browser", None)
+            if browser is None or not hasattr(browser, "new_context"):
+                raise TypeError("isolated pages need a launched browser (not a persistent context)")
+            option = dict(self.th._context_option)
+            storage_state = self.th._stored_state()
+            if storage_state is not None:
+                option["storage_state"] = storage_state
+            option.update(self._context_option)
+            context = await browser.new_context(**option)
+            await self.th._prepare_context(context)
+        else:
+            context = getattr(self.th, "context", None)
+            if context is None:
+                raise TypeError("page pool needs a context, create ThreadsafeBrowser with no_context=False")
+
+        page = await context.new_page()
+
+        impl = page._impl_obj
+        baseline = {event: list(impl.listeners(event)) for event in impl.event_names()}
+        entry = _PoolEntry(page, context, baseline)
+        self._entries.add(entry)
+        return entry
+
+    async def _fill(self, count: Optional[int] = None):
+        count = self.max_size if count is None else min(count, self.max_size)
+        missing = max(0, count - self._created)
+        self._created += missing
+        entries = await asyncio.gather(*(self._new_entry() for _ in range(missing)), return_exceptions=True)
+
+        error = None
+        for entry in entries:
+            if isinstance(entry, BaseException):
+                self._created -= 1
+                error = error or entry
+                self._wake()
+            else:
+                self._idle.append(entry)
+                self._wake()
+        if error is not None:
+            raise error
+
+    async def _acquire(self, block: bool, timeout: Optional[float]) -> "Page":
+        if self._closed:
+            raise RuntimeError("page pool is closed")
+
+        loop = asyncio.get_running_loop()
+        deadline = None if timeout is None else loop.time() + timeout
+        while True:
+            while self._idle:
+                entry = self._idle.popleft()
+                if not entry.page.is_closed():
+                    self._in_use[entry.page] = entry
+                    return entry.page
+                # NOTE: closed while idle (crash, context closed), make room for a new one
+                await self._discard(entry)
+
+            if self._created < self.max_size:
+                self._created += 1
+                try:
+                    entry = await self._new_entry()
+                except BaseException:
+                    self._created -= 1
+                    self._wake()
+                    raise
+                self._in_use[entry.page] = entry
+                return entry.page
+
+            if not block:
+                raise PoolExhausted("all %i pages are in use" % self.max_size)
+            remaining = None if deadline is None else deadline - loop.time()
+            try:
+                if remaining is not None and remaining <= 0:
+                    raise asyncio.TimeoutError
+                await self._wait(remaining)
+            except asyncio.TimeoutError:
+                raise PoolExhausted("no page released within %ss" % timeout) from None
+            if self._closed:
+                raise RuntimeError("page pool is closed")
+
+    async def _release(self, page: "Page"):
+        entry = self._in_use.pop(page, None)
+        if entry is None:
+            raise ValueError("page does not belong to this pool or was already released")
+
+        if self._closed:
+            await self._discard(entry)
+            return
+
+        try:
+            await self._reset(entry)
+        except Exception:
+            # NOTE: a crashed or closed page can't be reused, drop it and
+            # let the next acquire create a fresh one
+            await self._discard(entry)
+            return
+
+        self._idle.append(entry)
+        self._wake()
+
+    async def _reset(self, entry: _PoolEntry):
+        page = entry.page
+        if page.is_closed():
+            raise RuntimeError("page is closed")
+
+        impl = page._impl_obj
+        for event in list(impl.event_names()):
+            keep = entry.baseline_listeners.get(event, ())
+            for listener in list(impl.listeners(event)):
+                if listener not in keep:
+                    impl.remove_listener(event, listener)
+
+        await page.unroute_all(behavior="ignoreErrors")
+        await page.goto("about:blank")
+        if self.clear_cookies:
+            await entry.context.clear_cookies()
+
+    async def _discard(self, entry: _PoolEntry):
+        self._entries.discard(entry)
+        self._created -= 1
+        self._wake()
+        try:
+            if self.isolated:
+                await entry.context.close()
+            elif not entry.page.is_closed():
+                await entry.page.close()
+        except Exception:
+            pass
+
+    async def _invalidate(self, context: Optional["BrowserContext"]):
+        """
+        Drop the idle pages of `context` (closed by a recycle), every idle page when `context` is None
+        (browser relaunched). Pages in use are dropped when given back, their reset fails.
+        """
+        stale = [entry for entry in self._idle
+                 if context is None or entry.context is context or entry.page.is_closed()]
+        if not stale:
+            return
+        self._idle = collections.deque(entry for entry in self._idle if entry not in stale)
+        await asyncio.gather(*(self._discard(entry) for entry in stale))
+
+    async def _close(self):
+        self._closed = True
+        entries: List[_PoolEntry] = list(self._idle)
+        self._idle.clear()
+        # NOTE: waiters raise "page pool is closed"
+        for waiter in self._waiters:
+            if not waiter.done():
+                waiter.set_result(None)
+        await asyncio.gather(*(self._discard(entry) for entry in entries))
+
+    # Async API ########################################################################################################
+    async def fill(self, count: Optional[int] = None):
+        return await self.th.create_task(self._fill(count), bypass_=True)
+
+    async def acquire(self, block: Optional[bool] = None, timeout: Optional[float] = None) -> "Page":
+        block = self.block if block is None else block
+        timeout = self.timeout if timeout is None else timeout
+        return await self.th.create_task(self._acquire(block, timeout), bypass_=True)
+
+    async def release(self, page: "Page"):
+        return await self.th.create_task(self._release(page), bypass_=True)
+
+    async def close(self):
+        return await self.th.create_task(self._close(), bypass_=True)
+
+    @contextlib.asynccontextmanager
+    async def page(self, block: Optional[bool] = None, timeout: Optional[float] = None):
+        page = await self.acquire(block=block, timeout=timeout)
+        try:
+            yield page
+        finally:
+            await self.release(page)
+
+    # Sync API #########################################################################################################
+    def fill_sync(self, count: Optional[int] = None, timeout_=120):
+        return self.th.run_threadsafe(self._fill(count), timeout_=timeout_, bypass_=True)
+
+    def acquire_sync(self, block: Optional[bool] = None, timeout: Optional[float] = None, timeout_=None) -> "Page":
+        # NOTE: waiting for a free page is bounded by `timeout`, not by `timeout_`
+        block = self.block if block is None else block
+        timeout = self.timeout if timeout is None else timeout
+        return self.th.run_threadsafe(self._acquire(block, timeout), timeout_=timeout_, bypass_=True)
+
+    def release_sync(self, page: "Page", timeout_=60):
+        return self.th.run_threadsafe(self._release(page), timeout_=timeout_, bypass_=True)
+
+    def close_sync(self, timeout_=60):
+        return self.th.run_threadsafe(self._close(), timeout_=timeout_, bypass_=True)
+
+    @contextlib.contextmanager
+    def page_sync(self, block: Optional[bool] = None, timeout: Optional[float] = None):
+        page = self.acquire_sync(block=block, timeout=timeout)
+        try:
+            yield page
+        finally:
+            self.release_sync(page)
@@ -0,0 +1,106 @@
+import os
+import socket
+from typing import (
+    List,
+    Optional,
+)
+
+# NOTE: Chromium: SingletonLock is a symlink to "<hostname>-<pid>" (Linux, macOS), "lockfile" on Windows.
+# Firefox: "lock" is a symlink to "<ip>:+<pid>" (Linux), ".parentlock" (Linux, macOS), "parent.lock" (Windows)
+CHROMIUM_LOCK_FILES = ("SingletonLock", "SingletonSocket", "lockfile")
+FIREFOX_LOCK_FILES = ("lock", "parent.lock", ".parentlock")
+LOCK_FILES = CHROMIUM_LOCK_FILES + FIREFOX_LOCK_FILES
+
+BROWSER_PROCESS_NAMES = ("chrome", "chromium", "msedge", "headless_shell", "firefox")
+
+
+def _read_link(path: str) -> Optional[str]:
+    try:
+        return os.readlink(path)
+    except (OSError, NotImplementedError):
+        return None
+
+
+def _pid_from_chromium_lock(path: str) -> Optional[int]:
+    target = _read_link(os.path.join(path, "SingletonLock"))
+    if not target or "-" not in target:
+        return None
+    host, pid = target.rsplit("-", 1)
+    if host != socket.gethostname() or not pid.isdigit():
+        # NOTE: profile on a shared drive, locked by another host
+        return None
+    return int(pid)
+
+
+def _pid_from_firefox_lock(path: str) -> Optional[int]:
+    target = _read_link(os.path.join(path, "lock"))
+    if not target or "+" not in target:
+        return None
+    pid = target.rsplit("+", 1)[1]
+    return int(pid) if pid.isdigit() else None
+
+
+def has_lock_files(path: str) -> bool:
+    return any(os.path.lexists(os.path.join(path, name)) for name in LOCK_FILES)
+
+
+def lock_owner(path: str) -> Optional[int]:
+    """Pid written in the profile lock files by a browser of this host, alive or not."""
+    pid = _pid_from_chromium_lock(path)
+    return pid if pid is not None else _pid_from_firefox_lock(path)
+
+
+def _is_browser(name: Optional[str]) -> bool:
+    name = (name or "").lower()
+    return any(browser in name for browser in BROWSER_PROCESS_NAMES)
+
+
+def _uses_profile(cmdline: List[str], path: str) -> bool:
+    for index, arg in enumerate(cmdline):
+        if arg.startswith("--user-data-dir="):
+            value = arg.split("=", 1)[1]
+        elif arg in ("--user-data-dir", "-profile", "--profile") and index + 1 < len(cmdline):
+            value = cmdline[index + 1]
+        else:
+            continue
+        if os.path.normpath(value.strip('"')) == path:
+            return True
+    return False
+
+
+def scan_profile_processes(path: str) -> list:
+    import psutil
+
+    path = os.path.normpath(path)
+    processes = []
+    for proc in psutil.process_iter(["name", "cmdline"]):
+        if not _is_browser(proc.info["name"]):
+            continue
+        if _uses_profile(proc.info["cmdline"] or [], path):
+            processes.append(proc)
+    return processes
+
+
+def find_profile_processes(path: str) -> list:
+    """
+    Browser processes using the profile at `path`. The profile lock files are read
+    first, the process table is only scanned when they exist but hold no pid
+    (Windows, .parentlock, profile locked from another host).
+    """
+    import psutil
+
+    if not has_lock_files(path):
+        return []
+
+    pid = lock_owner(path)
+    if pid is None:
+        return scan_profile_processes(path)
+
+    try:
+        proc = psutil.Process(pid)
+        if _is_browser(proc.name()):
+            return [proc]
+    except psutil.Error:
+        pass
+    # NOTE: stale lock, the browser is gone (or the pid was reused)
+    return []
@@ -0,0 +1,183 @@
+import asyncio
+import logging
+import time
+from typing import (
+    TYPE_CHECKING,
+    Optional,
+)
+
+if TYPE_CHECKING:
+    from PlaywrightSafeThread.browser.threadsafe_browser import ThreadsafeBrowser
+
+Logger = logging.getLogger("PlaywrightSafeThread")
+
+
+class RecyclePolicy:
+    """
+    When to replace ThreadsafeBrowser context and page by fresh ones, any reached threshold triggers it:
+        max_navigations: main frame navigations of the context pages
+        max_age: seconds since the context was created
+        max_rss: bytes, resident memory of the browser processes (needs psutil)
+
+    `keep_storage_state` carries cookies and local storage over to the new context. In-flight calls are
+    waited for (at most `drain_timeout` seconds) and new ones are held back while the context is swapped.
+    """
+
+    def __init__(
+            self,
+            max_navigations: Optional[int] = None,
+            max_age: Optional[float] = None,
+            max_rss: Optional[int] = None,
+            keep_storage_state: bool = True,
+            check_interval: float = 30.0,
+            drain_timeout: Optional[float] = 30.0,
+    ):
+        self.max_navigations = max_navigations
+        self.max_age = max_age
+        self.max_rss = max_rss
+        self.keep_storage_state = keep_storage_state
+        self.check_interval = check_interval
+        self.drain_timeout = drain_timeout
+
+
+def driver_pid(playwright) -> Optional[int]:
+    # NOTE: not part of playwright API, the browsers are children of the driver process
+    try:
+        return playwright._impl_obj._connection._transport._proc.pid
+    except AttributeError:
+        return None
+
+
+def browser_rss(pid: Optional[int]) -> int:
+    """Resident memory of the processes started by the driver `pid` (by this process when unknown)."""
+    import psutil
+
+    try:
+        root = psutil.Process(pid) if pid else psutil.Process()
+        children = root.children(recursive=True)
+    except psutil.Error:
+        return 0
+    rss = 0
+    for child in children:
+        try:
+            rss += child.memory_info().rss
+        except psutil.Error:
+            # exited meanwhile
+            pass
+    return rss
+
+
+class Recycler:
+    """Apply a `RecyclePolicy` to a ThreadsafeBrowser, every method but `snapshot` runs on its loop."""
+
+    def __init__(self, th: "ThreadsafeBrowser", policy: Optional[RecyclePolicy] = None):
+        self.th = th
+        self.policy = policy or RecyclePolicy()
+
+        self.navigations = 0
+        self.since = time.monotonic()
+        self.recycles = 0
+        self.last_reason: Optional[str] = None
+        self.last_duration: Optional[float] = None
+        self.last_rss: Optional[int] = None
+
+        self._task: Optional[asyncio.Task] = None
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._lock: Optional[asyncio.Lock] = None
+
+    @property
+    def enabled(self) -> bool:
+        policy = self.policy
+        return any(value is not None for value in (policy.max_navigations, policy.max_age, policy.max_rss))
+
+    def start(self):
+        if not self.enabled:
+            return
+        if self.policy.max_navigations is not None:
+            self.attach(self.th.context)
+        if self.policy.max_age is not None or self.policy.max_rss is not None:
+            self._schedule_check()
+
+    def stop(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+    # Triggers #########################################################################################################
+    def attach(self, context):
+        if self.policy.max_navigations is None:
+            return
+        context.on("page", self._watch_page)
+        for page in context.pages:
+            self._watch_page(page)
+
+    def _watch_page(self, page):
+        page.on("framenavigated", self._on_navigated)
+
+    def _on_navigated(self, frame):
+        if frame.parent_frame is not None:
+            return
+        self.navigations += 1
+        if self.navigations >= self.policy.max_navigations:
+            self.trigger("navigations")
+
+    def _schedule_check(self):
+        self._timer = self.th.loop.call_later(self.policy.check_interval, self._check)
+
+    def _check(self):
+        policy = self.policy
+        if policy.max_age is not None and time.monotonic() - self.since >= policy.max_age:
+            self.trigger("age")
+        elif policy.max_rss is not None:
+            # NOTE: walking the process tree takes a few ms, keep it off the loop
+            pid = driver_pid(self.th.playwright)
+            future = self.th.loop.run_in_executor(None, browser_rss, pid)
+            future.add_done_callback(self._on_rss)
+        self._schedule_check()
+
+    def _on_rss(self, future: asyncio.Future):
+        if future.cancelled() or future.exception() is not None:
+            return
+        self.last_rss = future.result()
+        if self.last_rss >= self.policy.max_rss:
+            self.trigger("rss")
+
+    def trigger(self, reason: str):
+        if self._task is None or self._task.done():
+            self._task = self.th.loop.create_task(self._recycle_logged(reason))
+
+    async def _recycle_logged(self, reason: str):
+        try:
+            await self.recycle(reason)
+        except Exception:
+            # already logged, the next trigger tries again
+            pass
+
+    # Recycle ##########################################################################################################
+    async def recycle(self, reason: str = "manual"):
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            started = time.perf_counter()
+            try:
+                await self.th._recycle_context(self.policy.keep_storage_state, self.policy.drain_timeout)
+            except Exception:
+                Logger.exception("recycle context (%s)", reason)
+                raise
+            self.attach(self.th.context)
+            self.navigations = 0
+            self.since = time.monotonic()
+            self.recycles += 1
+            self.last_reason = reason
+            self.last_duration = time.perf_counter() - started
+            Logger.info("context recycled (%s) in %.3fs", reason, self.last_duration)
+
+    def snapshot(self) -> dict:
+        return {
+            "recycles": self.recycles,
+            "navigations": self.navigations,
+            "age": time.monotonic() - self.since,
+            "last_rss": self.last_rss,
+            "last_reason": self.last_reason,
+            "last_duration": self.last_duration,
+        }
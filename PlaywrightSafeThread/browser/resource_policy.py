@@ -0,0 +1,140 @@
+import collections
+import fnmatch
+import logging
+import re
+from typing import (
+    Dict,
+    Iterable,
+    List,
+    Optional,
+    Pattern,
+    Tuple,
+    Union,
+)
+from urllib.parse import urlsplit
+
+Logger = logging.getLogger("PlaywrightSafeThread")
+
+# ex: ResourcePolicy(block_types=MEDIA_TYPES)
+MEDIA_TYPES = ("image", "media", "font")
+
+
+def _glob_to_regex(glob: str) -> str:
+    try:
+        # NOTE: same semantics as the globs given to `context.route`
+        from playwright._impl._glob import glob_to_regex_pattern
+    except ImportError:
+        return fnmatch.translate(glob)
+    return glob_to_regex_pattern(glob)
+
+
+class ResourcePolicy:
+    """
+    Requests to abort, checked in this order:
+        block_types: resource types, ex: "image", "media", "font", "stylesheet" (`MEDIA_TYPES`)
+        deny_domains: hosts (and their subdomains)
+        allow_domains: when given, hosts (and their subdomains) not listed are blocked
+        block_urls: `context.route` globs (str) or compiled regular expressions
+
+    The rules are compiled once, all globs into a single regular expression. Blocked requests are
+    counted per rule in `hits` ("type:image", "domain:example.com", "url:**/*.js", ...), the
+    others in `allowed`.
+    """
+
+    def __init__(
+            self,
+            block_types: Iterable[str] = (),
+            block_urls: Iterable[Union[str, Pattern]] = (),
+            allow_domains: Optional[Iterable[str]] = None,
+            deny_domains: Iterable[str] = (),
+            abort_error: str = "blockedbyclient",
+    ):
+        self.block_types = frozenset(block_types)
+        self.block_urls = tuple(block_urls)
+        self.allow_domains = None if allow_domains is None else frozenset(d.lower().strip(".") for d in allow_domains)
+        self.deny_domains = frozenset(d.lower().strip(".") for d in deny_domains)
+        self.abort_error = abort_error
+
+        self.hits: Dict[str, int] = collections.Counter()
+        self.allowed = 0
+
+        globs = [url for url in self.block_urls if isinstance(url, str)]
+        self._globs = globs
+        self._glob_regex: Optional[Pattern] = None
+        if globs:
+            self._glob_regex = re.compile("|".join(
+                "(?P<_rule%i>%s)" % (index, _glob_to_regex(glob)) for index, glob in enumerate(globs)
+            ))
+        self._regexes: List[Pattern] = [url for url in self.block_urls if not isinstance(url, str)]
+
+    @property
+    def globs_only(self) -> bool:
+        """Only globs: they can be given to `context.route`, other requests are not intercepted at all."""
+        return bool(self._globs) and not (
+                self.block_types or self._regexes or self.deny_domains or self.allow_domains is not None
+        )
+
+    @staticmethod
+    def _domain_in(host: str, domains: frozenset) -> Optional[str]:
+        # "a.b.example.com" -> "a.b.example.com", "b.example.com", "example.com", "com"
+        while host:
+            if host in domains:
+                return host
+            host = host.partition(".")[2]
+        return None
+
+    def match(self, resource_type: str, url: str) -> Optional[str]:
+        """Name of the rule blocking this request, `None` when allowed."""
+        if resource_type in self.block_types:
+            return "type:" + resource_type
+
+        if self.deny_domains or self.allow_domains is not None:
+            host = (urlsplit(url).hostname or "").lower()
+            if host:
+                if self.deny_domains:
+                    domain = self._domain_in(host, self.deny_domains)
+                    if domain is not None:
+                        return "domain:" + domain
+                if self.allow_domains is not None and self._domain_in(host, self.allow_domains) is None:
+                    return "allow_domains"
+
+        if self._glob_regex is not None:
+            found = self._glob_regex.match(url)
+            if found is not None:
+                return "url:" + self._globs[int(found.lastgroup[5:])]
+        for regex in self._regexes:
+            if regex.search(url):
+                return "url:" + regex.pattern
+        return None
+
+    # Loop side ########################################################################################################
+    def routes(self) -> List[Tuple[str, object]]:
+        """(url, handler) to give to `context.route`."""
+        if self.globs_only:
+            return [(glob, self._abort_handler("url:" + glob)) for glob in self._globs]
+        return [("**/*", self._handle)]
+
+    async def install(self, context):
+        for url, handler in self.routes():
+            await context.route(url, handler)
+
+    def _abort_handler(self, rule: str):
+        async def _abort(route):
+            self.hits[rule] += 1
+            await route.abort(self.abort_error)
+
+        return _abort
+
+    async def _handle(self, route):
+        request = route.request
+        rule = self.match(request.resource_type, request.url)
+        if rule is None:
+            self.allowed += 1
+            # NOTE: fallback, not continue_: other routes (cache, user handlers) still get the request
+            await route.fallback()
+            return
+        self.hits[rule] += 1
+        await route.abort(self.abort_error)
+
+    def snapshot(self) -> dict:
+        return {"allowed": self.allowed, "hits": dict(self.hits)}
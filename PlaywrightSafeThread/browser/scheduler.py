@@ -0,0 +1,159 @@
+import collections
+import threading
+from typing import (
+    Any,
+    Callable,
+    Deque,
+    Dict,
+    Hashable,
+    List,
+    Optional,
+)
+
+
+class Job:
+    __slots__ = ("coro", "future", "submitted", "key", "priority", "caller")
+
+    def __init__(self, coro, future, submitted: float, key: Optional[Hashable], priority: int, caller: int):
+        self.coro = coro
+        self.future = future
+        self.submitted = submitted
+        self.key = key
+        self.priority = priority
+        self.caller = caller
+
+
+class Scheduler:
+    """
+    Admission control in front of the loop, every method runs on the loop thread.
+
+    - jobs sharing a `key` (ex: a page) run one at a time, in submission order
+    - at most `max_in_flight` jobs run at once (`None`: no limit)
+    - a higher `priority` runs first, jobs of the same priority are taken round robin
+      between caller threads, so one thread flooding the browser can't starve the others
+
+    `start(job)` is called to run an admitted job, `done(job)` must be called once it finished.
+    Jobs whose future was cancelled while queued are handed to `skip(job)` instead.
+    """
+
+    def __init__(
+            self,
+            start: Callable[[Job], Any],
+            skip: Callable[[Job], Any],
+            max_in_flight: Optional[int] = None,
+    ):
+        if max_in_flight is not None and max_in_flight < 1:
+            raise ValueError("max_in_flight must be >= 1")
+        self.max_in_flight = max_in_flight
+        self.in_flight = 0
+        self.queued = 0
+        self.parked = 0
+
+        self._start = start
+        self._skip = skip
+        # priority -> caller -> jobs ready to run, callers are rotated to be served in turn
+        self._ready: Dict[int, "collections.OrderedDict[int, Deque[Job]]"] = {}
+        # key -> jobs waiting for the running (or ready) job of that key
+        self._keys: Dict[Hashable, Deque[Job]] = {}
+
+    def push(self, job: Job):
+        key = job.key
+        if key is not None:
+            parked = self._keys.get(key)
+            if parked is not None:
+                parked.append(job)
+                self.parked += 1
+                return
+            self._keys[key] = collections.deque()
+        self._push_ready(job)
+        self._pump()
+
+    def done(self, job: Job):
+        self.in_flight -= 1
+        self._release(job.key)
+        self._pump()
+
+    def _push_ready(self, job: Job):
+        callers = self._ready.get(job.priority)
+        if callers is None:
+            callers = self._ready[job.priority] = collections.OrderedDict()
+        jobs = callers.get(job.caller)
+        if jobs is None:
+            jobs = callers[job.caller] = collections.deque()
+        jobs.append(job)
+        self.queued += 1
+
+    def _release(self, key: Optional[Hashable]):
+        if key is None:
+            return
+        parked = self._keys[key]
+        if parked:
+            self.parked -= 1
+            self._push_ready(parked.popleft())
+        else:
+            del self._keys[key]
+
+    def _pop_ready(self) -> Optional[Job]:
+        if not self._ready:
+            return None
+        priority = max(self._ready)
+        callers = self._ready[priority]
+        caller, jobs = next(iter(callers.items()))
+        job = jobs.popleft()
+        if jobs:
+            callers.move_to_end(caller)
+        else:
+            del callers[caller]
+            if not callers:
+                del self._ready[priority]
+        self.queued -= 1
+        return job
+
+    def _pump(self):
+        while self.max_in_flight is None or self.in_flight < self.max_in_flight:
+            job = self._pop_ready()
+            if job is None:
+                return
+            if job.future.cancelled():
+                # cancelled (or timed out) while queued
+                self._skip(job)
+                self._release(job.key)
+                continue
+            self.in_flight += 1
+            self._start(job)
+
+    def drain(self) -> List[Job]:
+        # Jobs that never started, once the loop is stopped
+        jobs = []
+        while True:
+            job = self._pop_ready()
+            if job is None:
+                break
+            jobs.append(job)
+        for parked in self._keys.values():
+            jobs.extend(parked)
+        self._keys.clear()
+        self.queued = self.parked = 0
+        return jobs
+
+    def snapshot(self) -> dict:
+        # NOTE: may be called from any thread, containers are copied before iterating
+        by_priority = {}
+        by_caller = collections.Counter()
+        for priority, callers in list(self._ready.items()):
+            count = 0
+            for caller, jobs in list(callers.items()):
+                count += len(jobs)
+                by_caller[caller] += len(jobs)
+            by_priority[priority] = count
+        by_key = {repr(key): len(parked) for key, parked in list(self._keys.items()) if parked}
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        return {
+            "in_flight": self.in_flight,
+            "max_in_flight": self.max_in_flight,
+            "queued": self.queued,
+            "parked": self.parked,
+            "by_priority": by_priority,
+            "by_caller": {names.get(caller, caller): count for caller, count in by_caller.items()},
+            "by_key": by_key,
+        }
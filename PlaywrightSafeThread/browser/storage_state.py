@@ -0,0 +1,118 @@
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+from typing import (
+    TYPE_CHECKING,
+    Optional,
+)
+
+from PlaywrightSafeThread.browser.http_cache import write_atomic
+from PlaywrightSafeThread.browser.install_cache import CACHE_DIR
+
+if TYPE_CHECKING:
+    from PlaywrightSafeThread.browser.threadsafe_browser import ThreadsafeBrowser
+
+Logger = logging.getLogger("PlaywrightSafeThread")
+
+STORAGE_STATE_DIR = os.path.join(CACHE_DIR, "storage_state")
+
+
+class StorageStateStore:
+    """
+    Snapshots of a context `storage_state()` (cookies, local storage) kept in `<directory>/<name>.json`.
+
+    ThreadsafeBrowser saves one every `interval` seconds and on close, and builds its new contexts
+    (pages pool, recycle, relaunch, next start) from the freshest one, written by this process
+    or another one. Snapshots older than `max_age` seconds are ignored.
+    """
+
+    def __init__(
+            self,
+            name: str = "default",
+            directory: str = STORAGE_STATE_DIR,
+            interval: Optional[float] = 300.0,
+            max_age: Optional[float] = None,
+    ):
+        self.name = name
+        self.path = os.path.join(directory, name + ".json")
+        self.interval = interval
+        self.max_age = max_age
+
+        self.saves = 0
+        self.last_saved: Optional[float] = None
+
+        self._lock = threading.Lock()
+        self._state: Optional[dict] = None
+        self._taken = 0.0
+        self._th: Optional["ThreadsafeBrowser"] = None
+        self._timer: Optional[asyncio.TimerHandle] = None
+
+    # Any thread #######################################################################################################
+    def remember(self, state: dict, taken: Optional[float] = None):
+        """Keep `state` in memory, without writing it."""
+        taken = time.time() if taken is None else taken
+        with self._lock:
+            if taken >= self._taken:
+                self._state, self._taken = state, taken
+
+    def save(self, state: dict):
+        write_atomic(self.path, json.dumps(state).encode("utf-8"))
+        # NOTE: taken at the file mtime, `load` doesn't read back our own snapshot
+        self.remember(state, os.path.getmtime(self.path))
+        self.saves += 1
+        self.last_saved = time.time()
+
+    def load(self) -> Optional[dict]:
+        """Freshest snapshot, from memory or from the file when another process wrote it since."""
+        with self._lock:
+            state, taken = self._state, self._taken
+        try:
+            modified = os.path.getmtime(self.path)
+        except OSError:
+            modified = None
+        if modified is not None and modified > taken:
+            try:
+                with open(self.path, encoding="utf-8") as f:
+                    state = json.load(f)
+                taken = modified
+                self.remember(state, taken)
+            except (OSError, ValueError) as e:
+                Logger.warning("read storage state %s: %r", self.path, e)
+        if state is None or (self.max_age is not None and time.time() - taken > self.max_age):
+            return None
+        return state
+
+    # Loop side ########################################################################################################
+    def start(self, th: "ThreadsafeBrowser"):
+        self._th = th
+        if self.interval is not None:
+            self._schedule()
+
+    def stop(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+    def _schedule(self):
+        self._timer = self._th.loop.call_later(self.interval, self._tick)
+
+    def _tick(self):
+        self._th.loop.create_task(self.snapshot(self._th.context))
+        self._schedule()
+
+    async def snapshot(self, context) -> Optional[dict]:
+        """Save the storage state of `context`, the file is written off the loop."""
+        try:
+            state = await context.storage_state()
+        except Exception as e:
+            # closed or crashed meanwhile
+            Logger.debug("storage state snapshot: %r", e)
+            return None
+        try:
+            await asyncio.get_running_loop().run_in_executor(None, self.save, state)
+        except OSError:
+            Logger.exception("write storage state %s", self.path)
+        return state
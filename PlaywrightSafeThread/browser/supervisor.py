@@ -0,0 +1,258 @@
+import asyncio
+import collections
+import functools
+import logging
+import time
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Callable,
+    Deque,
+    List,
+    Optional,
+    Tuple,
+)
+
+from PlaywrightSafeThread.browser.metrics import DEFAULT_BUCKETS, Histogram
+
+if TYPE_CHECKING:
+    from PlaywrightSafeThread.browser.threadsafe_browser import ThreadsafeBrowser
+
+Logger = logging.getLogger("PlaywrightSafeThread")
+
+
+class RelaunchPolicy:
+    """
+    How ThreadsafeBrowser recovers when the browser disconnects (process died) or its page crashes.
+
+    A lost browser is launched again with a new context on the running driver, a crashed page is
+    replaced in the same context. Calls submitted meanwhile wait for the new browser. A call given
+    as a callable (not a coroutine) that failed because of the loss is called again, up to `retries`
+    times, it must not hold on the old page: `th.goto` or `lambda: th.page.goto(url)`, not `th.page.goto`.
+
+    max_restarts: restarts allowed in `window` seconds, then calls fail with the browser gone
+    max_attempts, backoff: launch attempts per restart, `backoff * 2 ** attempt` seconds apart
+    keep_storage_state: restore the storage state saved every `state_interval` seconds
+    """
+
+    def __init__(
+            self,
+            retries: int = 1,
+            max_restarts: int = 5,
+            window: float = 600.0,
+            max_attempts: int = 3,
+            backoff: float = 1.0,
+            keep_storage_state: bool = True,
+            state_interval: float = 30.0,
+    ):
+        self.retries = retries
+        self.max_restarts = max_restarts
+        self.window = window
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.keep_storage_state = keep_storage_state
+        self.state_interval = state_interval
+
+
+class Supervisor:
+    """Apply a `RelaunchPolicy` to a ThreadsafeBrowser, every method but `snapshot` runs on its loop."""
+
+    def __init__(self, th: "ThreadsafeBrowser", policy: RelaunchPolicy):
+        self.th = th
+        self.policy = policy
+
+        self.generation = 0
+        self.relaunching = False
+        self.failed = False
+        self.stopping = False
+        self.last_storage_state: Optional[dict] = None
+
+        self.restarts = 0
+        self.restart_failures = 0
+        self.retried_calls = 0
+        self.last_reason: Optional[str] = None
+        self.last_duration: Optional[float] = None
+        self.restart_duration = Histogram(DEFAULT_BUCKETS)
+
+        self._restarted_at: Deque[float] = collections.deque()
+        self._listeners: List[Tuple[Any, str, Callable]] = []
+        self._ready: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._timer: Optional[asyncio.TimerHandle] = None
+
+    def start(self):
+        self._ready = asyncio.Event()
+        self._ready.set()
+        self.watch()
+        if self.policy.keep_storage_state:
+            self._schedule_save()
+
+    def stop(self):
+        self.stopping = True
+        self.unwatch()
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+    # Detection ########################################################################################################
+    def watch(self):
+        """Listen to the current browser (or persistent context) and page."""
+        th = self.th
+        self.unwatch()
+        if th.context is th.browser:
+            # persistent context, closing it is losing the browser
+            self._listen(th.context, "close", "disconnected")
+        else:
+            self._listen(th.browser, "disconnected", "disconnected")
+        self._listen(th.page, "crash", "crash")
+
+    def unwatch(self):
+        # NOTE: before closing them on purpose (recycle, stop)
+        for emitter, event, listener in self._listeners:
+            try:
+                emitter.remove_listener(event, listener)
+            except Exception:
+                pass
+        self._listeners = []
+
+    def _listen(self, emitter: Any, event: str, reason: str):
+        listener = functools.partial(self._on_lost, reason)
+        emitter.on(event, listener)
+        self._listeners.append((emitter, event, listener))
+
+    def _on_lost(self, reason: str, *_):
+        self.trigger(reason)
+
+    def _browser_alive(self) -> bool:
+        browser = self.th.browser
+        return not hasattr(browser, "is_connected") or browser.is_connected()
+
+    def trigger(self, reason: str):
+        if self.stopping or self.relaunching:
+            return
+        self.relaunching = True
+        self.generation += 1
+        self._ready.clear()
+        # NOTE: hold new calls back, they would fail on the dead browser
+        self.th._dispatcher.pause()
+        self._task = self.th.loop.create_task(self._relaunch(reason))
+
+    # Relaunch #########################################################################################################
+    def _budget_left(self) -> bool:
+        now = time.monotonic()
+        restarted_at = self._restarted_at
+        while restarted_at and now - restarted_at[0] > self.policy.window:
+            restarted_at.popleft()
+        return len(restarted_at) < self.policy.max_restarts
+
+    async def _relaunch(self, reason: str):
+        started = time.perf_counter()
+        policy = self.policy
+        try:
+            if not self._budget_left():
+                Logger.error("browser lost (%s), %i restarts in %ss already, giving up",
+                             reason, policy.max_restarts, policy.window)
+                self.failed = True
+                return
+            self._restarted_at.append(time.monotonic())
+
+            for attempt in range(policy.max_attempts):
+                try:
+                    await self._restore(reason)
+                    break
+                except Exception:
+                    Logger.exception("relaunch browser (%s), attempt %i", reason, attempt + 1)
+                    if attempt + 1 < policy.max_attempts:
+                        await asyncio.sleep(policy.backoff * 2 ** attempt)
+            else:
+                self.failed = True
+                self.restart_failures += 1
+                return
+
+            self.failed = False
+            self.restarts += 1
+            self.last_reason = reason
+            self.last_duration = time.perf_counter() - started
+            self.restart_duration.observe(self.last_duration)
+            Logger.warning("browser recovered (%s) in %.3fs", reason, self.last_duration)
+        finally:
+            self.relaunching = False
+            self._ready.set()
+            self.th._dispatcher.resume()
+
+    async def _restore(self, reason: str):
+        th = self.th
+        if reason == "crash" and self._browser_alive():
+            try:
+                await th.page.close()
+            except Exception:
+                pass
+            th.page = await th.context.new_page()
+        else:
+            storage_state = None
+            if self.policy.keep_storage_state:
+                storage_state = th._stored_state() or self.last_storage_state
+            await th._relaunch(storage_state=storage_state)
+            th.recycler.attach(th.context)
+        self.watch()
+
+    async def wait_ready(self) -> bool:
+        await self._ready.wait()
+        return not self.failed
+
+    # Retries ##########################################################################################################
+    async def retrying(self, factory, args, kwargs):
+        attempt = 0
+        while True:
+            generation = self.generation
+            try:
+                return await factory(*args, **kwargs)
+            except Exception:
+                if attempt >= self.policy.retries or not await self._lost_since(generation):
+                    raise
+                attempt += 1
+                self.retried_calls += 1
+                Logger.info("retrying %r after browser relaunch", factory)
+
+    async def _lost_since(self, generation: int) -> bool:
+        # NOTE: a call may fail before the disconnected event is dispatched
+        await asyncio.sleep(0)
+        if self.generation == generation and not self.relaunching:
+            if self._browser_alive():
+                return False
+            self.trigger("disconnected")
+        return await self.wait_ready()
+
+    # Storage state ####################################################################################################
+    def _schedule_save(self):
+        self._timer = self.th.loop.call_later(self.policy.state_interval, self._save)
+
+    def _save(self):
+        if not self.relaunching:
+            self.th.loop.create_task(self.save_storage_state())
+        self._schedule_save()
+
+    async def save_storage_state(self):
+        context = self.th.context
+        if context is self.th.browser:
+            # persistent context: the profile keeps it
+            return
+        try:
+            self.last_storage_state = await context.storage_state()
+        except Exception as e:
+            Logger.debug("save storage state: %r", e)
+            return
+        if self.th.storage_state_store is not None:
+            self.th.storage_state_store.remember(self.last_storage_state)
+
+    def snapshot(self) -> dict:
+        return {
+            "restarts": self.restarts,
+            "restart_failures": self.restart_failures,
+            "retried_calls": self.retried_calls,
+            "relaunching": self.relaunching,
+            "failed": self.failed,
+            "last_reason": self.last_reason,
+            "last_duration": self.last_duration,
+            "restart_duration": self.restart_duration.snapshot(),
+        }
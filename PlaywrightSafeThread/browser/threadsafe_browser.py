@@ -1,37 +1,60 @@
 # from: https://github.com/medialab/minet/blob/master/minet/browser/threadsafe_browser.py
 
+import functools
 import inspect
 import logging
 import os
+import queue
 import subprocess
 import sys
 import tempfile
-from concurrent.futures import Future
+import time
+import weakref
+from concurrent.futures import Executor, Future, ThreadPoolExecutor
 from typing import (
+    TYPE_CHECKING,
     Callable,
     Awaitable,
+    FrozenSet,
+    Iterable,
+    Iterator,
+    List,
     Set,
     Optional,
     Literal,
+    Tuple,
 )
 import asyncio
 import platform
 from threading import Thread, Event, Lock
-from playwright.async_api import (
-    async_playwright,
-    Browser,
-    Page,
-    BrowserType
-)
-from playwright._impl._driver import compute_driver_executable, get_driver_env
+
+from PlaywrightSafeThread.browser import batch_eval, install_cache
+from PlaywrightSafeThread.browser.dispatch import Dispatcher
+from PlaywrightSafeThread.browser.events import EventForwarder, EventStream, OverflowPolicy
+from PlaywrightSafeThread.browser.http_cache import HttpCache
+from PlaywrightSafeThread.browser.init_scripts import InitScripts
+from PlaywrightSafeThread.browser.loop_monitor import LoopMonitor
+from PlaywrightSafeThread.browser.metrics import DispatchMetrics, operation_name
+from PlaywrightSafeThread.browser.page_pool import PagePool
+from PlaywrightSafeThread.browser.recycle import RecyclePolicy, Recycler
+from PlaywrightSafeThread.browser.resource_policy import ResourcePolicy
+from PlaywrightSafeThread.browser.storage_state import StorageStateStore
+from PlaywrightSafeThread.browser.supervisor import RelaunchPolicy, Supervisor
+from PlaywrightSafeThread.browser.tracing import ChromeTracer
+
+if TYPE_CHECKING:
+    from playwright.async_api import Page
 
 sys_os = platform.system()
 
 UNIX = "windows" not in sys_os.lower()
 LTE_PY37 = platform.python_version_tuple()[:2] <= ("3", "7")
+GTE_PY312 = sys.version_info >= (3, 12)
 
 SUPPORTED_BROWSERS = ("chromium", "firefox", "webkit")
 BrowserName = Literal["chromium", "firefox", "webkit"]
+SAME_LOOP_POLICIES = ("task", "raise")
+SameLoopPolicy = Literal["task", "raise"]
 # T = TypeVar("T")
 # P = ParamSpec("P")
 PageCallable = Callable  # [Concatenate[Page, P], Awaitable[T]]
@@ -53,9 +76,74 @@ class ThreadsafeBrowser:
             close_already_profile=True,
             loop=None,
             playwright_path_env=True,
+            same_loop: SameLoopPolicy = "task",
+            cancel_grace: Optional[float] = 5.0,
+            callback_executor: Optional[Executor] = None,
+            start: bool = True,
+            metrics: bool = False,
+            monitor_loop: bool = False,
+            slow_callback_threshold: float = 0.1,
+            trace_path: Optional[str] = None,
+            scheduler: bool = False,
+            max_in_flight: Optional[int] = None,
+            recycle: Optional[RecyclePolicy] = None,
+            relaunch: Optional[RelaunchPolicy] = None,
+            resource_policy: Optional[ResourcePolicy] = None,
+            http_cache: Optional[HttpCache] = None,
+            storage_state_store: Optional[StorageStateStore] = None,
+            init_scripts: Iterable[str] = (),
             **kwargs
     ) -> None:
         """
+        same_loop : "task" or "raise"
+            What `run_threadsafe` (and the `*_sync` helpers) do when called from ThreadsafeBrowser loop, ex: in a
+            `page.on` handler. Blocking there would freeze the loop that has to run the task, so with "task" the
+            coroutine is scheduled and the `asyncio.Task` is returned right away, with "raise" a RuntimeError is raised.
+        cancel_grace : Union[float, None]
+            When a call times out (`timeout_`) its task is cancelled on the loop, a task still running `cancel_grace`
+            seconds later is logged and counted in `leaked_tasks`. `None` disables the check.
+        callback_executor : Union[concurrent.futures.Executor, None]
+            Executor running the callbacks given to `submit`, defaults to a thread pool created on first use.
+        start : bool
+            Start the loop thread and the browser before returning (startup errors are raised here). With `False`
+            call `start()`, it returns a `concurrent.futures.Future` set once ready, see also `launch_async`.
+        metrics : bool
+            Record per operation queue wait, execution time, outcomes and in-flight calls in `th.metrics`
+            (`th.metrics.snapshot()`, `th.metrics.to_prometheus()`).
+        monitor_loop : bool
+            Measure the loop lag with a heartbeat, time every callback and log the ones blocking the loop
+            longer than `slow_callback_threshold` seconds with their stack, see `LoopMonitor` for what is
+            not timed and `th.loop_monitor.snapshot()`.
+        trace_path : Union[str, None]
+            Write Chrome Trace Event JSON of every submission (caller thread, queue, run on the loop, result
+            delivery) to this file, open it in https://ui.perfetto.dev. The file is completed by `stop()`.
+        scheduler : bool
+            Queue submissions on the loop instead of starting them right away: calls given the same `key_` (the
+            helpers use the page) run one at a time, a higher `priority_` runs first and caller threads are served
+            round robin. See `th.queue_depths()`. Calls made from the loop itself are not queued.
+        max_in_flight : Union[int, None]
+            At most this many submitted calls run at once, implies `scheduler`. Page pool, event listener and
+            recycle calls are not counted, they start right away (`bypass_=True`).
+        recycle : Union[RecyclePolicy, None]
+            Replace `context` and `page` after some navigations, some time or above some browser memory, see
+            `RecyclePolicy`. In-flight calls are waited for first, pages of the old context must not be used after.
+        relaunch : Union[RelaunchPolicy, None]
+            Launch the browser again on the running driver when it disconnects or the page crashes, restoring the
+            last saved storage state. Calls wait meanwhile and failed callables are retried, see `RelaunchPolicy`
+            and `th.supervisor.snapshot()`.
+        resource_policy : Union[ResourcePolicy, None]
+            Abort requests by resource type, domain or url in every context created by ThreadsafeBrowser (pools,
+            recycled and relaunched ones too), see `th.resource_policy.snapshot()` for the hits per rule.
+        http_cache : Union[HttpCache, None]
+            Serve scripts, stylesheets, fonts and images from an on disk cache shared by every context, browser and
+            process using the same directory, see `HttpCache`. Blocked requests never reach it.
+        storage_state_store : Union[StorageStateStore, None]
+            Save `context.storage_state()` periodically and on close, new contexts (first one included) start from
+            the freshest snapshot, so logins survive recycles, relaunches and restarts.
+        init_scripts : Iterable[str]
+            Scripts run in every page before its own ones. They are joined (after the playwright-stealth evasions with
+            `stealthy=True`) and added once to each context created by ThreadsafeBrowser, see `th.add_init_script`.
+
         Browser Parameters
         ----------
         executable_path : Union[pathlib.Path, str, None]
@@ -227,47 +315,52 @@ class ThreadsafeBrowser:
         """
         if browser not in SUPPORTED_BROWSERS:
             raise TypeError("unsupported browser")
+        if same_loop not in SAME_LOOP_POLICIES:
+            raise TypeError("unsupported same_loop policy")
 
         # NOTE: on unix python 3.7, child watching does not
         # work properly when asyncio is not running from the main thread
-        # if UNIX and LTE_PY37:
-        #     from PlaywrightSafeThread._future_.threaded_child_watcher import ThreadedChildWatcher
-        #     asyncio.set_child_watcher(ThreadedChildWatcher())
+        install_child_watcher()
 
         self.install_callback = install_callback
         self._stealthy = stealthy
+        self.init_scripts = InitScripts(init_scripts, stealth=stealthy)
         self._no_context = no_context
         self._browser_name = browser
+        self._same_loop = same_loop
+        self._callback_executor = callback_executor
+        self._own_callback_executor = False
+        self._callback_executor_lock = Lock()
 
         self._browser_option = {}
         self._browser_persistent_option = {}
         self._context_option = {}
 
-        # get parameters foreach function
-        __browser_option = inspect.getfullargspec(BrowserType.launch).kwonlyargs
-        __browser_persistent_option = inspect.getfullargspec(BrowserType.launch_persistent_context).kwonlyargs + [
-            "user_data_dir"]
-        __context_option = inspect.getfullargspec(Browser.new_context).kwonlyargs
+        __browser_option, __browser_persistent_option, __context_option = option_routes()
 
+        unknown = []
         for key in kwargs:
+            known = False
             if key in __browser_option:
-                self._browser_option.update({key: kwargs[key]})
+                self._browser_option[key] = kwargs[key]
+                known = True
             if key in __browser_persistent_option:
-                self._browser_persistent_option.update({key: kwargs[key]})
+                self._browser_persistent_option[key] = kwargs[key]
+                known = True
             if key in __context_option:
-                self._context_option.update({key: kwargs[key]})
+                self._context_option[key] = kwargs[key]
+                known = True
+            if not known and key != "PLAYWRIGHT_BROWSERS_PATH":
+                unknown.append(key)
+        if unknown:
+            Logger.warning("unknown option(s) ignored: %s", ", ".join(sorted(unknown)))
 
         if playwright_path_env:
             os.environ.setdefault("PLAYWRIGHT_BROWSERS_PATH",
                                   kwargs.get("PLAYWRIGHT_BROWSERS_PATH") or self.PLAYWRIGHT_BROWSERS_PATH
                                   )
 
-        # if install:
-        #     from PlaywrightSafeThread.browser.plawright_shim import run_playwright
-        #     run_playwright("install", self._browser_name)
-        if install and not self.check_is_install(self._browser_name):
-            self.run_playwright("install", self._browser_name)
-
+        self._install = install
         self.__check_open_dir = check_open_dir
         self.__close_already_profile = close_already_profile
 
@@ -278,18 +371,97 @@ class ThreadsafeBrowser:
             name="Thread-browser-%i" % id(self), target=self.__thread_worker
         )
 
-        # TODO::
-        self.running_futures: Set[Future] = set()
+        self.metrics: Optional[DispatchMetrics] = DispatchMetrics() if metrics else None
+        self.tracer: Optional[ChromeTracer] = ChromeTracer(trace_path) if trace_path else None
+        self._dispatcher = Dispatcher(
+            self.loop,
+            cancel_grace=cancel_grace,
+            metrics=self.metrics,
+            tracer=self.tracer,
+            scheduler=scheduler,
+            max_in_flight=max_in_flight,
+        )
+        self.loop_monitor: Optional[LoopMonitor] = LoopMonitor(
+            self.loop, threshold=slow_callback_threshold
+        ) if monitor_loop else None
+        self.resource_policy = resource_policy
+        self.http_cache = http_cache
+        self.storage_state_store = storage_state_store
+        self.recycler = Recycler(self, recycle)
+        self.supervisor: Optional[Supervisor] = Supervisor(self, relaunch) if relaunch else None
+        # NOTE: pools register themselves, their idle pages are dropped on recycle and relaunch
+        self._pools: "weakref.WeakSet[PagePool]" = weakref.WeakSet()
+        self.running_futures: Set[Future] = self._dispatcher.running_futures
+        # NOTE: kept for backward compatibility, the dispatcher registry is lock free
         self.running_futures_lock = Lock()
 
-        # Starting loop thread
-        self.thread.start()
-        # Wait Finish Thread
-        self.start_event.wait()
+        # NOTE: seconds spent in each startup phase (install, driver, launch, context, page, total)
+        self.startup_timings = {}
+        self.ready: Future = Future()
+        self._start_lock = Lock()
+
+        if start:
+            # Starting loop thread and wait until the browser is ready
+            self.start().result()
+
+    @classmethod
+    def launch_async(cls, **kwargs) -> Future:
+        """
+        Create a ThreadsafeBrowser and start it in the background, the returned future
+        resolves to the instance (or the startup error). Several browsers can start at once:
+
+            futures = [ThreadsafeBrowser.launch_async(headless=True) for _ in range(8)]
+            browsers = [future.result() for future in futures]
+        """
+        return cls(start=False, **kwargs).start()
+
+    def start(self) -> Future:
+        with self._start_lock:
+            if not self.thread.is_alive() and not self.ready.done():
+                self.ready.set_running_or_notify_cancel()
+                self.thread.start()
+        return self.ready
+
+    def __install(self):
+        # if install:
+        #     from PlaywrightSafeThread.browser.plawright_shim import run_playwright
+        #     run_playwright("install", self._browser_name)
+        if not self.check_is_install(self._browser_name):
+            with install_cache.install_lock(self.get_driver_env()):
+                # NOTE: another process may have installed it while we were waiting for the lock
+                if not self.check_is_install(self._browser_name, invalidate=True):
+                    self.run_playwright("install", self._browser_name)
+                    self.check_is_install(self._browser_name, invalidate=True)
 
     def __thread_worker(self):
+        self._dispatcher.bind()
         asyncio.set_event_loop(self.loop)
-        self.loop.run_until_complete(self.__start_playwright())
+        started = time.perf_counter()
+        try:
+            if self._install:
+                self.__install()
+                self.startup_timings["install"] = time.perf_counter() - started
+            self.loop.run_until_complete(self.__start_playwright())
+        except BaseException as e:
+            # NOTE: without this the caller waiting for the browser would hang forever
+            Logger.exception("start playwright")
+            try:
+                self.loop.run_until_complete(self.__stop_playwright())
+            except BaseException:
+                pass
+            self.ready.set_exception(e)
+            self.start_event.set()
+            return
+        self.startup_timings["total"] = time.perf_counter() - started
+        if self.loop_monitor is not None:
+            self.loop_monitor.start(self._dispatcher.thread_id)
+        if not self._no_context:
+            self.recycler.start()
+            if self.storage_state_store is not None:
+                self.storage_state_store.start(self)
+            if self.supervisor is not None:
+                self.supervisor.start()
+        self.ready.set_result(self)
         self.start_event.set()
 
         # NOTE: we are now ready to accept tasks
@@ -300,64 +472,79 @@ class ThreadsafeBrowser:
 
         self.loop.run_until_complete(self.__stop_playwright())
 
-    async def create_task(self, task, *args, **kwargs):
+    async def create_task(self, task, *args, key_=None, priority_=0, bypass_=False, name_=None, **kwargs):
         if not asyncio.iscoroutine(task):
-            task = task(*args, **kwargs)
+            task, name = self.__call(task, args, kwargs)
+            name_ = name_ or name
 
         if self.is_same_loop:
-            # TODO :: use __handle_future
-            return await self.loop.create_task(task)
+            return await task
 
-        future = asyncio.run_coroutine_threadsafe(task, self.loop)
-        return self.__handle_future(future)
-        # return asyncio.run_coroutine_threadsafe(task, self.loop).result()
+        # NOTE: awaiting the future does not block the caller loop
+        return await self._dispatcher.wait_async(
+            self._dispatcher.submit(task, name=name_, key=key_, priority=priority_, bypass=bypass_))
 
     @property
     def is_same_loop(self):
-        try:
-            return asyncio.get_event_loop() == self.loop
-        except Exception as e:
-            if 'There is no current event loop in thread' in str(e):
-                return True
-            raise e
-
-    def run_threadsafe(self, task, *args, timeout_=120, **kwargs):
-        if not asyncio.iscoroutine(task):
-            task = task(*args, **kwargs)
+        return self._dispatcher.in_loop_thread
 
-        if not self.is_same_loop:
-            future = asyncio.run_coroutine_threadsafe(task, self.loop)
-            return self.__handle_future(future, timeout=timeout_)
+    @property
+    def timed_out_tasks(self) -> int:
+        return self._dispatcher.timed_out
 
-            # def _on_completion(f):
-            #     exception = f.exception()
-            #
-            #     if exception:
-            #         raise exception
-            #
-            # future.add_done_callback(_on_completion)
+    @property
+    def cancelled_tasks(self) -> int:
+        return self._dispatcher.cancelled
 
-            # result = future.result(timeout=timeout_)
-            # return result
+    @property
+    def leaked_tasks(self) -> int:
+        return self._dispatcher.leaked
 
-        # TODO :: use __handle_future
-        start_event_task = Event()
+    def queue_depths(self) -> Optional[dict]:
+        """Calls running and waiting in the scheduler (by priority, caller thread and key), `None` without one."""
+        scheduler = self._dispatcher.scheduler
+        return None if scheduler is None else scheduler.snapshot()
 
-        async def run_task(task_):
-            r = await task_
-            start_event_task.set()
-            return r
+    def run_threadsafe(self, task, *args, timeout_=120, key_=None, priority_=0, bypass_=False, name_=None, **kwargs):
+        if not asyncio.iscoroutine(task):
+            task, name = self.__call(task, args, kwargs)
+            name_ = name_ or name
 
-        future = self.loop.create_task(
-            run_task(task)
-        )
+        if not self.is_same_loop:
+            future = self._dispatcher.submit(task, name=name_, key=key_, priority=priority_, bypass=bypass_)
+            return self.__handle_future(future, timeout=timeout_)
 
-        start_event_task.wait(timeout_)
-        result = future.result()
-        return result
+        return self.__run_same_loop(task)
+
+    def __call(self, task, args, kwargs) -> Tuple[Awaitable, str]:
+        # coroutine and operation name of a callable
+        # NOTE: with a supervisor a callable can be called again on the relaunched browser,
+        # the call is named after it rather than after `Supervisor.retrying`
+        if self.supervisor is not None and self.supervisor.policy.retries:
+            return self.supervisor.retrying(task, args, kwargs), operation_name(task)
+        coro = task(*args, **kwargs)
+        return coro, operation_name(coro)
+
+    def _current_page(self):
+        # scheduler key of the calls on `self.page`, resolved on the loop when the call gets there
+        return self.page
+
+    def __run_same_loop(self, task):
+        # NOTE: waiting here would block the very loop that has to run the task
+        if self._same_loop == "raise":
+            task.close()
+            raise RuntimeError(
+                "can't wait for a task in ThreadsafeBrowser loop, use `await th.create_task(...)` instead"
+            )
+        return self.loop.create_task(task)
 
     async def __start_playwright(self) -> None:
+        from playwright.async_api import async_playwright
+
+        timings = self.startup_timings
+        phase_start = time.perf_counter()
         self.playwright = await async_playwright().start()
+        timings["driver"] = time.perf_counter() - phase_start
 
         if self._browser_name == "chromium":
             self.browser_type = self.playwright.chromium
@@ -371,22 +558,53 @@ class ThreadsafeBrowser:
         else:
             raise TypeError("unsupported browser")
         if not self._no_context:
-            # TODO: we need to find a way to force frozen executable to use the same
-            # directory as non-frozen one, e.g. by mangling PLAYWRIGHT_BROWSERS_PATH
-            # or sys.frozen
-            if self._browser_persistent_option.get("user_data_dir"):
-                # ToDo: check_profile
-                if self.__check_open_dir:
-                    self.check_close_profile(self._browser_persistent_option.get("user_data_dir"))
-                self.context = await self.browser_type.launch_persistent_context(**self._browser_persistent_option)
-                self.browser = self.context.browser or self.context
-                self._api_request_context = self.context.request
-            else:
-                self.browser = await self.browser_type.launch(**self._browser_option)
-                self.context = await self.browser.new_context(**self._context_option)
-                self._api_request_context = self.context.request
-
-            self.page = await self.first_page()
+            await self.__launch(timings)
+
+    async def __launch(self, timings: dict, storage_state=None) -> None:
+        # TODO: we need to find a way to force frozen executable to use the same
+        # directory as non-frozen one, e.g. by mangling PLAYWRIGHT_BROWSERS_PATH
+        # or sys.frozen
+        if self._browser_persistent_option.get("user_data_dir"):
+            # ToDo: check_profile
+            if self.__check_open_dir:
+                self.check_close_profile(self._browser_persistent_option.get("user_data_dir"))
+            phase_start = time.perf_counter()
+            self.context = await self.browser_type.launch_persistent_context(**self._browser_persistent_option)
+            self.browser = self.context.browser or self.context
+            self._api_request_context = self.context.request
+            await self._prepare_context(self.context)
+            timings["launch"] = time.perf_counter() - phase_start
+        else:
+            phase_start = time.perf_counter()
+            self.browser = await self.browser_type.launch(**self._browser_option)
+            timings["launch"] = time.perf_counter() - phase_start
+
+            phase_start = time.perf_counter()
+            context_option = self._context_option
+            if storage_state is None:
+                storage_state = self._stored_state()
+            if storage_state is not None:
+                context_option = dict(context_option, storage_state=storage_state)
+            self.context = await self.browser.new_context(**context_option)
+            self._api_request_context = self.context.request
+            await self._prepare_context(self.context)
+            timings["context"] = time.perf_counter() - phase_start
+
+        phase_start = time.perf_counter()
+        self.page = await self.first_page()
+        timings["page"] = time.perf_counter() - phase_start
+
+    async def _relaunch(self, storage_state=None) -> dict:
+        """Launch browser, context and page again on the running driver, returns the phase timings."""
+        timings = {}
+        await self.__launch(timings, storage_state=storage_state)
+        await self._invalidate_pools(None)
+        return timings
+
+    async def _invalidate_pools(self, context):
+        # idle pool pages of `context` (None: of the previous browser, every one) are dead
+        for pool in list(self._pools):
+            await pool._invalidate(context)
 
     # def stop(self) -> None:
     #     self.loop.call_soon_threadsafe(self.loop.stop)
@@ -398,16 +616,31 @@ class ThreadsafeBrowser:
         # catastrophic chain reaction of exception will
         # make some jobs hang up and block indefinitely
         # which will cause a deadlock.
-        # TODO::
-        with self.running_futures_lock:
-            for fut in self.running_futures:
-                if not fut.done():
-                    fut.cancel()
-
-        self.loop.call_soon_threadsafe(self.loop.stop)
-        self.thread.join()
+        self._dispatcher.cancel_all()
+        if self.loop_monitor is not None:
+            self.loop_monitor.stop()
+
+        # NOTE: the thread is not alive when never started or when startup failed
+        if self.thread.is_alive():
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            if self.is_same_loop:
+                # NOTE: the loop thread finishes shutting down once the current callback returns
+                return
+            self.thread.join()
+        self._dispatcher.cancel_pending()
+        if self.tracer is not None:
+            self.tracer.close()
+        if self._own_callback_executor:
+            self._callback_executor.shutdown(wait=False)
 
     async def __stop_playwright(self) -> None:
+        self.recycler.stop()
+        if self.supervisor is not None:
+            self.supervisor.stop()
+        if self.storage_state_store is not None:
+            self.storage_state_store.stop()
+            if getattr(self, "context", None) is not None:
+                await self.storage_state_store.snapshot(self.context)
         # NOTE: we need to make sure those were actually launched, in
         # case of a nasty race condition
         try:
@@ -442,25 +675,11 @@ class ThreadsafeBrowser:
 
     def check_close_profile(self, path):
         try:
-            import psutil
-            for proc in psutil.process_iter():
-                name = proc.name()
-                if "chrome.exe" in name:
-                    cmd = proc.cmdline()
-                    user = list(filter(lambda x: "--user-data-dir" in x, cmd))
-                    if user:
-                        # path_old.add(p)
-                        p = os.path.normpath(user[0].split("=")[-1])
-                        if os.path.normpath(path) == p and self.__close_already_profile:
-                            proc.terminate()
-
-                elif "firefox.exe" in name:
-                    cmd = proc.cmdline()
-                    user = list(filter(lambda x: "-profile" in x, cmd))
-                    if user:
-                        p = os.path.normpath(cmd[cmd.index(user[0]) + 1])
-                        if os.path.normpath(path) == p and self.__close_already_profile:
-                            proc.terminate()
+            from PlaywrightSafeThread.browser.profile_lock import find_profile_processes
+
+            for proc in find_profile_processes(path):
+                if self.__close_already_profile:
+                    proc.terminate()
         except:
             Logger.exception("check_close_profile")
 
@@ -470,8 +689,24 @@ class ThreadsafeBrowser:
     def __exit__(self, *args):
         self.stop()
 
-    def check_is_install(self, browser):
+    def check_is_install(self, browser, invalidate=False):
+        # NOTE: asking the driver costs a node startup, the install location is cached
+        # on disk and only checked for existence, `invalidate=True` asks the driver again
         env = self.get_driver_env()
+        key = install_cache.cache_key(browser, env)
+        if not invalidate and install_cache.lookup(key):
+            return True
+
+        locale_ = self.__install_location(browser, env)
+        if locale_ and os.path.exists(locale_):
+            install_cache.store(key, locale_)
+            return True
+        return False
+
+    @staticmethod
+    def __install_location(browser, env):
+        from playwright._impl._driver import compute_driver_executable
+
         driver_executable, driver_cli = compute_driver_executable()
 
         completed_process = subprocess.check_output([driver_executable, driver_cli, 'install', browser, '--dry-run'],
@@ -480,11 +715,12 @@ class ThreadsafeBrowser:
 
         locale_ = ":".join(next(filter(lambda x: "Install location" in x,
                                        completed_process.decode().split("\n")), "").split(":")[1:]).strip()
-
-        return locale_ and os.path.exists(locale_)
+        return locale_
 
     @staticmethod
     def get_driver_env():
+        from playwright._impl._driver import get_driver_env
+
         env = get_driver_env()
 
         # env["PLAYWRIGHT_BROWSERS_PATH"] =
@@ -494,6 +730,8 @@ class ThreadsafeBrowser:
         return env
 
     def run_playwright(self, *args: str):
+        from playwright._impl._driver import compute_driver_executable
+
         env = self.get_driver_env()
         driver_executable, driver_cli = compute_driver_executable()
 
@@ -506,36 +744,188 @@ class ThreadsafeBrowser:
 
     ####################################################################################################################
     async def first_page(self) -> "Page":
-        page = self.context.pages[0] if self.context.pages else await self.context.new_page()
+        return self.context.pages[0] if self.context.pages else await self.context.new_page()
+
+    def _stored_state(self) -> Optional[dict]:
+        # freshest storage state snapshot for a new context
+        if self.storage_state_store is None:
+            return None
+        return self.storage_state_store.load()
+
+    async def _prepare_context(self, context):
+        # every context created by ThreadsafeBrowser
+        # NOTE: stealth and init scripts go to the context once, not to each page
+        await self.init_scripts.install(context)
+        # NOTE: the last registered route runs first, requests blocked by the policy never reach the cache
+        if self.http_cache is not None:
+            await self.http_cache.install(context)
+        if self.resource_policy is not None:
+            await self.resource_policy.install(context)
+
+    def pages(
+            self,
+            max_size: int = 4,
+            isolated: bool = False,
+            clear_cookies: bool = False,
+            block: bool = True,
+            timeout: Optional[float] = None,
+            prefill: bool = True,
+            **context_option
+    ) -> PagePool:
+        """
+        Create a bounded pool of pages, every caller thread can `acquire_sync` its own page
+        instead of sharing `self.page`. With `isolated=True` each page gets its own context
+        (`context_option` overrides the ones given to ThreadsafeBrowser). `clear_cookies` clears
+        the context cookies on release, it needs `isolated=True`: otherwise the pages share `self.context`.
+        """
+        pool = PagePool(
+            self,
+            max_size=max_size,
+            isolated=isolated,
+            clear_cookies=clear_cookies,
+            block=block,
+            timeout=timeout,
+            **context_option
+        )
+        if prefill:
+            pool.fill_sync()
+        return pool
+
+    def on(
+            self,
+            emitter,
+            event: str,
+            handler: Callable,
+            executor: Optional[Executor] = None,
+            max_queue: int = 1000,
+            overflow: OverflowPolicy = "drop_oldest",
+            coalesce_key: Optional[Callable] = None,
+            concurrency: int = 1,
+    ) -> EventForwarder:
+        """
+        Like `page.on(event, handler)` but `handler` runs on `executor` (default: `callback_executor`) instead of
+        ThreadsafeBrowser loop, so it may block or call the `*_sync` helpers. `emitter` is a page, a context, ...
+
+        At most `max_queue` events wait for `handler`, then with `overflow`:
+            "drop_oldest" (default): the oldest waiting event is dropped (`forwarder.dropped`)
+            "coalesce": a waiting event with the same `coalesce_key(payload)` is replaced by the new one
+            "block": the listener waits on the loop for room, it throttles `handler` but does not bound
+                memory: playwright starts a task per event, the waiting ones pile up on the loop
+
+        Events are handled in order by one worker, `concurrency` allows more (unordered).
+        Call `close()` on the returned forwarder to stop listening.
+        """
+        return EventForwarder(
+            self,
+            emitter,
+            event,
+            handler,
+            executor=executor,
+            max_queue=max_queue,
+            overflow=overflow,
+            coalesce_key=coalesce_key,
+            concurrency=concurrency,
+        ).start()
+
+    def stream(
+            self,
+            emitter,
+            event: str,
+            predicate: Optional[Callable[[object], bool]] = None,
+            maxsize: int = 1000,
+    ) -> EventStream:
+        """
+        Events of `emitter` (page, context, ...) matching `predicate` as an iterator, usable with `for` from any
+        thread or `async for` from any loop. At most `maxsize` events are kept, the oldest are dropped first.
+        `close()` the stream (or use it as a context manager) to stop listening.
+        """
+        return EventStream(self, emitter, event, predicate=predicate, maxsize=maxsize).start()
+
+    async def _recycle_context(self, keep_storage_state=True, drain_timeout: Optional[float] = 30.0):
+        # NOTE: runs on the loop, new calls wait until the new page is there
+        dispatcher = self._dispatcher
+        dispatcher.pause()
+        if self.supervisor is not None:
+            # NOTE: the old context is closed on purpose
+            self.supervisor.unwatch()
+        try:
+            if not await dispatcher.drain(drain_timeout):
+                Logger.warning("calls still running after %ss, recycling the context anyway", drain_timeout)
+            old_context = self.context
+            if self._browser_persistent_option.get("user_data_dir"):
+                # the profile keeps the state
+                await old_context.close()
+                self.context = await self.browser_type.launch_persistent_context(**self._browser_persistent_option)
+                self.browser = self.context.browser or self.context
+            else:
+                context_option = self._context_option
+                if keep_storage_state:
+                    storage_state = await old_context.storage_state()
+                    if self.storage_state_store is not None:
+                        self.storage_state_store.remember(storage_state)
+                    context_option = dict(context_option, storage_state=storage_state)
+                self.context = await self.browser.new_context(**context_option)
+                try:
+                    await old_context.close()
+                except Exception:
+                    Logger.exception("close recycled context")
+            self._api_request_context = self.context.request
+            await self._prepare_context(self.context)
+            self.page = await self.first_page()
+            await self._invalidate_pools(old_context)
+        finally:
+            if self.supervisor is not None:
+                self.supervisor.watch()
+            dispatcher.resume()
 
-        if self._stealthy:
-            from playwright_stealth import stealth_async
-            await stealth_async(page)
-        return page
+    async def recycle(self):
+        """Replace `context` and `page` now, see `RecyclePolicy`."""
+        await self.create_task(self.recycler.recycle("manual"), bypass_=True)
+
+    def recycle_sync(self, timeout_=120):
+        return self.run_threadsafe(self.recycler.recycle("manual"), timeout_=timeout_, bypass_=True)
 
     async def close(self):
-        await self.create_task(self.__stop_playwright())
+        if self.thread.is_alive():
+            await self.create_task(self.__stop_playwright())
         self.stop()
 
     async def goto(self, url, *args, page=None, **kwargs):
         page = page or self.page
-        return await self.create_task(page.goto(url, *args, **kwargs))
+        return await self.create_task(page.goto(url, *args, **kwargs), key_=page)
+
+    async def add_init_script(self, script=None, path=None):
+        """Run `script` (or the content of `path`) in every page from now on, current context and next ones."""
+        script = self.init_scripts.add(script, path=path)
+        if getattr(self, "context", None) is not None:
+            await self.create_task(self.context.add_init_script(script))
 
     async def add_script_tag(self, *args, page=None, **kwargs):
         page = page or self.page
-        return await self.create_task(page.add_script_tag(*args, **kwargs))
+        return await self.create_task(page.add_script_tag(*args, **kwargs), key_=page)
 
     async def expose_function(self, *args, page=None, **kwargs):
         page = page or self.page
-        return await self.create_task(page.expose_function(*args, **kwargs))
+        return await self.create_task(page.expose_function(*args, **kwargs), key_=page)
 
     async def page_wait_for_function(self, *args, page=None, **kwargs):
         page = page or self.page
-        return await self.create_task(page.wait_for_function(*args, **kwargs))
+        return await self.create_task(page.wait_for_function(*args, **kwargs), key_=page)
 
     async def page_evaluate(self, *args, page=None, **kwargs):
         page = page or self.page
-        return await self.create_task(page.evaluate(*args, **kwargs))
+        return await self.create_task(page.evaluate(*args, **kwargs), key_=page)
+
+    async def page_evaluate_many(self, expressions_with_args, page=None, return_exceptions=True):
+        """Several `page_evaluate` in one call, see `batch_eval.evaluate_many`."""
+        page = page or self.page
+        return await self.create_task(
+            batch_eval.evaluate_many(page, expressions_with_args, return_exceptions), key_=page)
+
+    async def extract(self, schema, page=None):
+        """Many selectors read in one call, see `batch_eval.extract`."""
+        page = page or self.page
+        return await self.create_task(batch_eval.extract(page, schema), key_=page)
 
     ####################################################################################################################
     def sleep(self, val, timeout_=None):
@@ -544,46 +934,201 @@ class ThreadsafeBrowser:
         self.run_threadsafe(asyncio.sleep(val), timeout_=timeout_)
 
     def goto_sync(self, url, *args, page=None, timeout_=60, **kwargs):
-        page = page or self.page
-        return self.run_threadsafe(page.goto(url, *args, **kwargs), timeout_=timeout_)
+        # NOTE: `self.page` is read when the call runs, it may be replaced meanwhile (recycle, relaunch),
+        # the scheduler key too (`_current_page`)
+        return self.run_threadsafe(self.goto, url, *args, page=page, timeout_=timeout_, key_=page or self._current_page,
+                                   name_="Page.goto", **kwargs)
+
+    def add_init_script_sync(self, script=None, path=None, timeout_=60):
+        return self.run_threadsafe(self.add_init_script, script, path=path, timeout_=timeout_)
 
     def add_script_tag_sync(self, *args, page=None, timeout_=60, **kwargs):
-        page = page or self.page
-        return self.run_threadsafe(page.add_script_tag(*args, **kwargs), timeout_=timeout_)
+        return self.run_threadsafe(self.add_script_tag, *args, page=page, timeout_=timeout_, key_=page or self._current_page,
+                                   name_="Page.add_script_tag", **kwargs)
 
     def expose_function_sync(self, *args, page=None, timeout_=60, **kwargs):
-        page = page or self.page
-        return self.run_threadsafe(page.expose_function(*args, **kwargs), timeout_=timeout_)
+        return self.run_threadsafe(self.expose_function, *args, page=page, timeout_=timeout_, key_=page or self._current_page,
+                                   name_="Page.expose_function", **kwargs)
 
     def page_wait_for_function_sync(self, *args, page=None, timeout_=60, **kwargs):
-        page = page or self.page
-        return self.run_threadsafe(page.wait_for_function(*args, **kwargs), timeout_=timeout_)
+        return self.run_threadsafe(self.page_wait_for_function, *args, page=page, timeout_=timeout_, key_=page or self._current_page,
+                                   name_="Page.wait_for_function", **kwargs)
 
     def page_evaluate_sync(self, *args, page=None, timeout_=60, **kwargs, ):
-        page = page or self.page
-        return self.run_threadsafe(page.evaluate(*args, **kwargs), timeout_=timeout_)
+        return self.run_threadsafe(self.page_evaluate, *args, page=page, timeout_=timeout_, key_=page or self._current_page,
+                                   name_="Page.evaluate", **kwargs)
+
+    def page_evaluate_many_sync(self, expressions_with_args, page=None, return_exceptions=True, timeout_=60):
+        return self.run_threadsafe(self.page_evaluate_many, expressions_with_args, page=page,
+                                   return_exceptions=return_exceptions, timeout_=timeout_,
+                                   key_=page or self._current_page, name_="evaluate_many")
+
+    def extract_sync(self, schema, page=None, timeout_=60):
+        return self.run_threadsafe(self.extract, schema, page=page, timeout_=timeout_, key_=page or self._current_page,
+                                   name_="extract")
 
     def sync_close(self, timeout_=60):
-        self.run_threadsafe(self.__stop_playwright(), timeout_=timeout_)
+        # NOTE: from the loop thread, playwright is stopped by __thread_worker once the loop stops
+        if not self.is_same_loop and self.thread.is_alive():
+            self.run_threadsafe(self.__stop_playwright(), timeout_=timeout_)
         self.stop()
 
     ###########################
     def __handle_future(self, future: Future, timeout=None):
-        with self.running_futures_lock:
-            self.running_futures.add(future)
+        return self._dispatcher.wait(future, timeout=timeout)
 
+    @staticmethod
+    def _as_coroutines(tasks: Iterable) -> list:
+        return [task if asyncio.iscoroutine(task) else task() for task in tasks]
+
+    async def _gather_many(self, coros: list, ordered: bool, return_exceptions: bool) -> list:
+        tasks = [self.loop.create_task(coro) for coro in coros]
+        try:
+            if ordered:
+                return await asyncio.gather(*tasks, return_exceptions=return_exceptions)
+
+            # NOTE: (index, result), completion order alone doesn't tell which task gave what
+            index_of = {task: index for index, task in enumerate(tasks)}
+            results = []
+            done: Set[asyncio.Task] = set()
+            while len(done) < len(tasks):
+                finished, _ = await asyncio.wait(set(tasks) - done, return_when=asyncio.FIRST_COMPLETED)
+                for task in sorted(finished, key=index_of.get):
+                    done.add(task)
+                    exception = task.exception()
+                    if exception is not None and not return_exceptions:
+                        raise exception
+                    results.append((index_of[task], task.result() if exception is None else exception))
+            return results
+        finally:
+            # NOTE: on first error (or cancellation) don't leave the rest of the batch running
+            for task in tasks:
+                task.cancel()
+
+    async def _stream_many(self, coros: list, put: Callable) -> None:
+        def _on_done(index, task):
+            if task.cancelled():
+                return
+            exception = task.exception()
+            put((index, exception is None, task.result() if exception is None else exception))
+
+        tasks = []
+        for index, coro in enumerate(coros):
+            task = self.loop.create_task(coro)
+            task.add_done_callback(functools.partial(_on_done, index))
+            tasks.append(task)
         try:
-            return future.result(timeout=timeout)
+            await asyncio.wait(tasks)
         finally:
-            with self.running_futures_lock:
-                self.running_futures.remove(future)
+            for task in tasks:
+                task.cancel()
+
+    def run_many(self, tasks: Iterable, ordered=True, return_exceptions=False, timeout_=120) -> List:
+        """
+        Run a batch of coroutines (or callables returning coroutines) in one hop to the loop.
+        With `ordered=False` results come in completion order as `(index, result)` pairs.
+        """
+        coros = self._as_coroutines(tasks)
+        if not coros:
+            return []
+        return self.run_threadsafe(self._gather_many(coros, ordered, return_exceptions), timeout_=timeout_)
+
+    async def gather_threadsafe(self, *tasks, return_exceptions=False) -> List:
+        coros = self._as_coroutines(tasks)
+        if not coros:
+            return []
+        return await self.create_task(self._gather_many(coros, True, return_exceptions))
+
+    def as_completed_threadsafe(self, tasks: Iterable, return_exceptions=False, timeout_=None) -> Iterator[Tuple[int, object]]:
+        """
+        Submit a batch in one hop and yield `(index, result)` as soon as each one finishes.
+        Leaving the loop early (break, error, timeout) cancels what is still running.
+        """
+        # NOTE: checked and submitted right away, not on the first `next()`
+        if self.is_same_loop:
+            raise RuntimeError("as_completed_threadsafe can't block ThreadsafeBrowser loop, use gather_threadsafe")
+
+        coros = self._as_coroutines(tasks)
+        results = queue.SimpleQueue()
+        future = self._dispatcher.submit(self._stream_many(coros, results.put))
+        self.running_futures.add(future)
+        return self.__iter_completed(future, results, len(coros), return_exceptions, timeout_)
+
+    def __iter_completed(self, future: Future, results: queue.SimpleQueue, count: int, return_exceptions: bool,
+                         timeout_: Optional[float]) -> Iterator[Tuple[int, object]]:
+        deadline = None if timeout_ is None else time.monotonic() + timeout_
+        try:
+            for _ in range(count):
+                remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+                try:
+                    index, ok, value = results.get(timeout=remaining)
+                except queue.Empty:
+                    raise TimeoutError("as_completed_threadsafe timed out after %ss" % timeout_) from None
+                if not ok and not return_exceptions:
+                    raise value
+                yield index, value
+        finally:
+            future.cancel()
+            self.running_futures.discard(future)
+
+    def submit(
+            self,
+            task,
+            *args,
+            callback: Optional[Callable[[Future], None]] = None,
+            timeout_=None,
+            key_=None,
+            priority_=0,
+            name_=None,
+            **kwargs
+    ) -> Future:
+        """
+        Schedule a coroutine (or a callable returning one) and return a `concurrent.futures.Future` right away.
+        `callback(future)` runs on `callback_executor` once it is done, never on ThreadsafeBrowser loop.
+        With `timeout_` the future and the task are cancelled `timeout_` seconds after the submission
+        (counted in `timed_out_tasks`), time spent waiting for the loop or the scheduler included.
+        `name_` is the operation name in metrics and traces (default: the coroutine, or callable, qualname).
+        """
+        if asyncio.iscoroutine(task):
+            name = operation_name(task)
+        else:
+            task, name = self.__call(task, args, kwargs)
+        future = self._dispatcher.submit(task, name=name_ or name, key=key_, priority=priority_, timeout=timeout_)
+        self.running_futures.add(future)
+        future.add_done_callback(self.running_futures.discard)
+        if callback:
+            future.add_done_callback(functools.partial(self.__run_callback, callback))
+        return future
+
+    def _get_callback_executor(self) -> Executor:
+        if self._callback_executor is None:
+            with self._callback_executor_lock:
+                if self._callback_executor is None:
+                    self._callback_executor = ThreadPoolExecutor(thread_name_prefix="Thread-browser-callback")
+                    self._own_callback_executor = True
+        return self._callback_executor
+
+    def __run_callback(self, callback: Callable[[Future], None], future: Future):
+        def _callback():
+            try:
+                callback(future)
+            except Exception:
+                Logger.exception("submit callback")
+
+        # NOTE: done callbacks fire on the loop thread, keep user code off it
+        try:
+            self._get_callback_executor().submit(_callback)
+        except RuntimeError:
+            # executor already shut down
+            Logger.warning("callback %r dropped, callback executor is shut down", callback)
 
     def run_in_loop(self, task):
         # it to run Any task in self.loop
-        future = asyncio.run_coroutine_threadsafe(task, self.loop)
-        return self.__handle_future(future)
+        if self.is_same_loop:
+            return self.__run_same_loop(task)
+        return self.__handle_future(self._dispatcher.submit(task))
 
-    async def to_do_with_callback_(self, task, callback: Optional[Callable[[Page], Awaitable[None]]] = None, ):
+    async def to_do_with_callback_(self, task, callback: Optional[Callable[["Page"], Awaitable[None]]] = None, ):
         # TODO::
         r = await task()
         if callback:
@@ -593,11 +1138,64 @@ class ThreadsafeBrowser:
     def to_do_with_callback(
             self,
             task,
-            callback: Optional[Callable[[Page], Awaitable[None]]] = None,
+            callback: Optional[Callable[["Page"], Awaitable[None]]] = None,
     ):
         return self.run_threadsafe(self.to_do_with_callback_(task, callback=callback, ))
 
 
+_CHILD_WATCHER_LOCK = Lock()
+_CHILD_WATCHER_INSTALLED = False
+
+
+def install_child_watcher():
+    # NOTE: once per process, the child watcher is global to asyncio.
+    # On Linux a pidfd watcher reaps the driver from the loop selector instead of
+    # one waitpid thread per child process, python >= 3.12 already does it alone
+    global _CHILD_WATCHER_INSTALLED
+    if not UNIX or GTE_PY312 or _CHILD_WATCHER_INSTALLED:
+        return
+
+    with _CHILD_WATCHER_LOCK:
+        if _CHILD_WATCHER_INSTALLED:
+            return
+        _CHILD_WATCHER_INSTALLED = True
+
+        from PlaywrightSafeThread._future_.pidfd_child_watcher import PidfdChildWatcher, can_use_pidfd
+        from PlaywrightSafeThread._future_.threaded_child_watcher import ThreadedChildWatcher
+
+        if can_use_pidfd():
+            watcher = PidfdChildWatcher()
+        elif LTE_PY37:
+            watcher = ThreadedChildWatcher()
+        else:
+            # asyncio default is already a threaded watcher
+            return
+
+        current = getattr(asyncio.get_event_loop_policy(), "_watcher", None)
+        if current is not None and type(current) is not getattr(asyncio, "ThreadedChildWatcher", None):
+            # a watcher was chosen by the application, keep it
+            return
+        asyncio.set_child_watcher(watcher)
+
+
+_OPTION_ROUTES: Optional[Tuple[FrozenSet[str], FrozenSet[str], FrozenSet[str]]] = None
+
+
+def option_routes() -> Tuple[FrozenSet[str], FrozenSet[str], FrozenSet[str]]:
+    # keyword arguments accepted by launch, launch_persistent_context and new_context,
+    # computed once per process
+    global _OPTION_ROUTES
+    if _OPTION_ROUTES is None:
+        from playwright.async_api import Browser, BrowserType
+
+        _OPTION_ROUTES = (
+            frozenset(inspect.getfullargspec(BrowserType.launch).kwonlyargs),
+            frozenset(inspect.getfullargspec(BrowserType.launch_persistent_context).kwonlyargs + ["user_data_dir"]),
+            frozenset(inspect.getfullargspec(Browser.new_context).kwonlyargs),
+        )
+    return _OPTION_ROUTES
+
+
 def creation_flags_dict():
     try:
         if sys_os == 'Windows':
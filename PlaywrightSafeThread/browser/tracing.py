@@ -0,0 +1,97 @@
+import itertools
+import json
+import os
+import queue
+import threading
+import time
+from typing import (
+    Optional,
+    Set,
+)
+
+_STOP = object()
+
+
+def now_us() -> float:
+    return time.perf_counter() * 1e6
+
+
+class ChromeTracer:
+    """
+    Write spans as Chrome Trace Event JSON (load it in https://ui.perfetto.dev or chrome://tracing).
+
+    Events are put on a bounded queue and written by a background thread as they come, when the
+    writer falls behind more than `max_buffer` events, new events are dropped and counted in
+    `dropped`. Submissions are linked to the task running on the browser loop with flow arrows.
+    """
+
+    def __init__(self, path: str, max_buffer: int = 10000, process_name: str = "PlaywrightSafeThread"):
+        self.path = path
+        self.dropped = 0
+
+        self._pid = os.getpid()
+        self._ids = itertools.count(1)
+        self._named_threads: Set[int] = set()
+        self._queue: queue.Queue = queue.Queue(max_buffer)
+        self._closed = False
+
+        self._file = open(path, "w", encoding="utf-8")
+        self._file.write("[\n")
+        self._first = True
+        self._writer = threading.Thread(name="Thread-browser-tracer-%i" % id(self), target=self._write_loop, daemon=True)
+        self._writer.start()
+
+        self._emit({"ph": "M", "name": "process_name", "pid": self._pid, "tid": 0, "args": {"name": process_name}})
+
+    def _emit(self, event: dict):
+        tid = event.setdefault("tid", threading.get_ident())
+        if tid not in self._named_threads:
+            # NOTE: events are emitted from the thread they describe
+            self._named_threads.add(tid)
+            self._put({"ph": "M", "name": "thread_name", "pid": self._pid, "tid": tid,
+                       "args": {"name": threading.current_thread().name}})
+        event["pid"] = self._pid
+        self._put(event)
+
+    def _put(self, event: dict):
+        if self._closed:
+            return
+        try:
+            self._queue.put_nowait(event)
+        except queue.Full:
+            self.dropped += 1
+
+    def new_id(self) -> int:
+        return next(self._ids)
+
+    def complete(self, name: str, start: float, end: float, cat: str = "dispatch", args: Optional[dict] = None):
+        event = {"ph": "X", "name": name, "cat": cat, "ts": start, "dur": max(end - start, 0.0)}
+        if args:
+            event["args"] = args
+        self._emit(event)
+
+    def flow_start(self, flow_id: int, ts: float, name: str = "dispatch"):
+        self._emit({"ph": "s", "id": flow_id, "name": name, "cat": "dispatch", "ts": ts})
+
+    def flow_end(self, flow_id: int, ts: float, name: str = "dispatch"):
+        self._emit({"ph": "f", "bp": "e", "id": flow_id, "name": name, "cat": "dispatch", "ts": ts})
+
+    def _write_loop(self):
+        write = self._file.write
+        while True:
+            event = self._queue.get()
+            if event is _STOP:
+                break
+            write(("" if self._first else ",\n") + json.dumps(event, separators=(",", ":")))
+            self._first = False
+            if self._queue.empty():
+                self._file.flush()
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(_STOP)
+        self._writer.join()
+        self._file.write("\n]\n")
+        self._file.close()
@@ -0,0 +1,89 @@
+"""
+Micro benchmark of the cross thread dispatch (run_threadsafe from worker threads).
+
+"legacy" reproduces the previous dispatch: `asyncio.get_event_loop()` check,
+`run_coroutine_threadsafe` and a global lock taken twice per call.
+
+    python -m benchmarks.dispatch_benchmark --calls 20000 --threads 8
+"""
+import argparse
+import asyncio
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+
+from PlaywrightSafeThread import ThreadsafeBrowser
+
+
+async def noop():
+    return None
+
+
+def legacy_run_threadsafe(th, lock, running, coro, timeout_=120):
+    try:
+        same_loop = asyncio.get_event_loop() == th.loop
+    except Exception as e:
+        if 'There is no current event loop in thread' not in str(e):
+            raise e
+        same_loop = True
+    assert not same_loop
+
+    future = asyncio.run_coroutine_threadsafe(coro, th.loop)
+    with lock:
+        running.add(future)
+    try:
+        return future.result(timeout=timeout_)
+    finally:
+        with lock:
+            running.remove(future)
+
+
+def measure(call, calls, threads):
+    def worker(n):
+        # NOTE: legacy path needs a current loop in the caller thread
+        asyncio.set_event_loop(asyncio.new_event_loop())
+        latencies = []
+        for _ in range(n):
+            start = time.perf_counter()
+            call(noop())
+            latencies.append(time.perf_counter() - start)
+        return latencies
+
+    per_thread = calls // threads
+    start = time.perf_counter()
+    with ThreadPoolExecutor(threads) as executor:
+        latencies = [x for part in executor.map(worker, [per_thread] * threads) for x in part]
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        "calls/s": len(latencies) / elapsed,
+        "p50 (us)": statistics.median(latencies) * 1e6,
+        "p99 (us)": latencies[int(len(latencies) * 0.99) - 1] * 1e6,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--calls", type=int, default=20000)
+    parser.add_argument("--threads", type=int, default=8)
+    args = parser.parse_args()
+
+    th = ThreadsafeBrowser(no_context=True)
+    try:
+        lock, running = Lock(), set()
+        results = {
+            "legacy": measure(lambda coro: legacy_run_threadsafe(th, lock, running, coro), args.calls, args.threads),
+            "dispatcher": measure(th.run_threadsafe, args.calls, args.threads),
+        }
+    finally:
+        th.sync_close()
+
+    print("%-12s %12s %12s %12s" % ("", "calls/s", "p50 (us)", "p99 (us)"))
+    for name, result in results.items():
+        print("%-12s %12.0f %12.1f %12.1f" % (name, result["calls/s"], result["p50 (us)"], result["p99 (us)"]))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,46 @@
+import asyncio
+import threading
+
+import pytest
+
+from PlaywrightSafeThread.browser.dispatch import Dispatcher
+
+
+@pytest.fixture
+def loop():
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    yield loop
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join()
+    loop.close()
+
+
+async def _value(value):
+    return value
+
+
+def test_raising_key_fails_only_its_submission(loop):
+    dispatcher = Dispatcher(loop, scheduler=True)
+
+    def _no_page():
+        raise AttributeError("no page")
+
+    failed = dispatcher.submit(_value(1), key=_no_page)
+    other = dispatcher.submit(_value(2), key="page")
+    with pytest.raises(AttributeError):
+        failed.result(timeout=1)
+    assert other.result(timeout=1) == 2
+
+
+def test_callable_key_resolved_on_the_loop(loop):
+    dispatcher = Dispatcher(loop, scheduler=True)
+    threads = []
+
+    def _key():
+        threads.append(threading.get_ident())
+        return "page"
+
+    assert dispatcher.submit(_value(1), key=_key).result(timeout=1) == 1
+    assert len(threads) == 1 and threads[0] != threading.get_ident()
@@ -0,0 +1,172 @@
+import email.utils
+import os
+import time
+
+import pytest
+
+from PlaywrightSafeThread.browser.http_cache import HttpCache, current_age, freshness_lifetime
+
+URL = "https://cdn.example.com/app.js"
+FRESH = {"cache-control": "max-age=600"}
+
+
+NOW = 1_700_000_000.0
+DAY = 24 * 3600.0
+
+
+def http_date(timestamp):
+    return email.utils.formatdate(timestamp, usegmt=True)
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return HttpCache(str(tmp_path))
+
+
+@pytest.mark.parametrize("headers, lifetime", [
+    ({"cache-control": "max-age=60"}, 60.0),
+    ({"cache-control": "public, s-maxage=300, max-age=60"}, 300.0),
+    ({"cache-control": "max-age", "expires": http_date(NOW + 60), "date": http_date(NOW)}, 60.0),
+    ({"cache-control": "max-age=abc"}, 0.0),
+    ({"cache-control": "no-cache, max-age=60"}, 0.0),
+    ({"cache-control": "private, max-age=60"}, None),
+    ({"cache-control": "no-store"}, None),
+    ({"expires": http_date(NOW + 120), "date": http_date(NOW)}, 120.0),
+    ({"expires": http_date(NOW - 120), "date": http_date(NOW)}, 0.0),
+    ({"expires": "0"}, 0.0),
+    ({"last-modified": http_date(NOW - 100 * 60), "date": http_date(NOW)}, 600.0),
+    ({"last-modified": http_date(NOW - 365 * DAY), "date": http_date(NOW)}, DAY),
+    ({}, 0.0),
+])
+def test_freshness_lifetime(headers, lifetime):
+    assert freshness_lifetime(headers, NOW, DAY) == lifetime
+
+
+@pytest.mark.parametrize("headers, age", [
+    ({}, 0.0),
+    ({"age": "30"}, 30.0),
+    ({"age": "x"}, 0.0),
+    ({"date": http_date(NOW - 45)}, 45.0),
+    ({"date": http_date(NOW - 45), "age": "100"}, 100.0),
+    ({"date": http_date(NOW + 45)}, 0.0),
+])
+def test_current_age(headers, age):
+    assert current_age(headers, NOW) == age
+
+
+def test_age_counts_against_freshness(cache):
+    assert cache.store("GET", URL, {}, {"cache-control": "max-age=600", "age": "500"}, 200, b"body")
+    variant, _ = cache.lookup("GET", URL, {})
+    assert variant["expires"] - variant["stored"] == pytest.approx(100, abs=1)
+
+
+def test_response_older_than_its_lifetime_not_stored(cache):
+    assert not cache.store("GET", URL, {}, {"cache-control": "max-age=600", "age": "900"}, 200, b"body")
+    # still stored when it can be revalidated
+    assert cache.store("GET", URL, {}, {"cache-control": "max-age=600", "age": "900", "etag": '"v1"'}, 200, b"body")
+    assert not cache._fresh(cache.lookup("GET", URL, {})[0], {})
+
+
+def test_refresh_counts_the_304_age(cache):
+    assert cache.store("GET", URL, {}, {"cache-control": "max-age=600", "etag": '"v1"'}, 200, b"body")
+    cache.refresh("GET", URL, {}, {"age": "200"})
+    variant, body = cache.lookup("GET", URL, {})
+    assert body == b"body"
+    assert variant["expires"] - variant["stored"] == pytest.approx(400, abs=1)
+
+
+@pytest.mark.parametrize("request_headers, response_headers", [
+    ({}, {"cache-control": "private, max-age=600"}),
+    ({}, {"cache-control": "no-store"}),
+    ({}, {"cache-control": "no-cache"}),
+    ({}, {}),
+    ({"authorization": "Bearer token"}, FRESH),
+    ({}, dict(FRESH, vary="*")),
+    ({}, dict(FRESH, vary="Accept-Language, Cookie")),
+])
+def test_not_stored(cache, request_headers, response_headers):
+    assert not cache.store("GET", URL, request_headers, response_headers, 200, b"body")
+    assert cache.lookup("GET", URL, request_headers) == (None, None)
+
+
+@pytest.mark.parametrize("cache_control", ["public, max-age=600", "max-age=600, must-revalidate", "s-maxage=600"])
+def test_authorized_stored_when_allowed(cache, cache_control):
+    request_headers = {"authorization": "Bearer token"}
+    assert cache.store("GET", URL, request_headers, {"cache-control": cache_control}, 200, b"body")
+    assert cache.lookup("GET", URL, request_headers)[1] == b"body"
+
+
+def test_no_cache_with_validator_stored_stale(cache):
+    assert cache.store("GET", URL, {}, {"cache-control": "no-cache", "etag": '"v1"'}, 200, b"body")
+    assert not cache._fresh(cache.lookup("GET", URL, {})[0], {})
+
+
+def test_vary_cookie_not_stored_without_the_cookie(cache):
+    # NOTE: playwright `request.headers` has no cookie, the variant would match every account
+    assert not cache.store("GET", URL, {"accept": "*/*"}, dict(FRESH, vary="Cookie"), 200, b"user a")
+    assert cache.lookup("GET", URL, {"accept": "*/*"}) == (None, None)
+
+
+def test_vary_cookie_variants(cache):
+    response = dict(FRESH, vary="Cookie")
+    assert cache.store("GET", URL, {"cookie": "session=a"}, response, 200, b"user a")
+    assert cache.store("GET", URL, {"cookie": "session=b"}, response, 200, b"user b")
+
+    assert cache.lookup("GET", URL, {"cookie": "session=a"})[1] == b"user a"
+    assert cache.lookup("GET", URL, {"cookie": "session=b"})[1] == b"user b"
+    assert cache.lookup("GET", URL, {"cookie": "session=c"}) == (None, None)
+    assert cache.lookup("GET", URL, {}) == (None, None)
+
+
+def test_vary_accept_encoding_ignored(cache):
+    # bodies are stored decoded
+    assert cache.store("GET", URL, {}, dict(FRESH, vary="Accept-Encoding"), 200, b"body")
+    assert cache.lookup("GET", URL, {"accept-encoding": "br"})[1] == b"body"
+
+
+def test_vary_star_not_stored(cache):
+    assert not cache.store("GET", URL, {}, dict(FRESH, vary="*"), 200, b"body")
+
+
+def _store_used_at(cache, url, body, used):
+    assert cache.store("GET", url, {}, FRESH, 200, body)
+    os.utime(cache._entry_path(cache.key("GET", url)), (used, used))
+
+
+def test_evict_least_recently_used_first(cache):
+    now = time.time()
+    _store_used_at(cache, URL + "?old", b"a" * 100, now - 300)
+    _store_used_at(cache, URL + "?new", b"b" * 100, now - 100)
+    _store_used_at(cache, URL + "?mid", b"c" * 100, now - 200)
+
+    cache.evict(target=200)
+    assert cache.evicted == 1
+    assert cache.lookup("GET", URL + "?old", {}) == (None, None)
+    assert cache.lookup("GET", URL + "?mid", {})[1] == b"c" * 100
+
+    # the lookup made ?mid the most recently used
+    cache.evict(target=100)
+    assert cache.lookup("GET", URL + "?new", {}) == (None, None)
+    assert cache.lookup("GET", URL + "?mid", {})[1] == b"c" * 100
+    assert cache.snapshot()["size"] == 100
+
+
+def test_evict_counts_shared_bodies_once(cache):
+    now = time.time()
+    _store_used_at(cache, URL + "?a", b"same" * 25, now - 300)
+    _store_used_at(cache, URL + "?b", b"same" * 25, now - 200)
+    _store_used_at(cache, URL + "?c", b"other" * 20, now - 100)
+
+    cache.evict(target=200)
+    assert cache.evicted == 0
+    cache.evict(target=100)
+    # the shared body is only freed once both entries are gone
+    assert cache.evicted == 2
+    assert cache.lookup("GET", URL + "?c", {})[1] == b"other" * 20
+
+
+def test_clear(cache):
+    cache.store("GET", URL, {}, FRESH, 200, b"body")
+    cache.clear()
+    assert cache.lookup("GET", URL, {}) == (None, None)
+    assert cache.snapshot()["size"] == 0
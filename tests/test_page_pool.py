@@ -0,0 +1,195 @@
+import asyncio
+import threading
+import time
+
+import pytest
+from pyee.asyncio import AsyncIOEventEmitter
+
+from PlaywrightSafeThread import PoolExhausted, ThreadsafeBrowser
+from PlaywrightSafeThread.browser.recycle import RecyclePolicy
+
+
+class FakePage:
+    def __init__(self):
+        self._impl_obj = AsyncIOEventEmitter()
+        self.closed = False
+
+    def on(self, event, listener):
+        self._impl_obj.on(event, listener)
+
+    def remove_listener(self, event, listener):
+        self._impl_obj.remove_listener(event, listener)
+
+    def is_closed(self):
+        return self.closed
+
+    async def unroute_all(self, behavior=None):
+        pass
+
+    async def goto(self, url, **kwargs):
+        await asyncio.sleep(0)
+
+    async def close(self):
+        self.closed = True
+
+
+class FakeContext:
+    request = None
+
+    def __init__(self):
+        self.pages = []
+
+    async def new_page(self):
+        page = FakePage()
+        self.pages.append(page)
+        return page
+
+    async def add_init_script(self, script):
+        pass
+
+    async def storage_state(self):
+        return {"cookies": [], "origins": []}
+
+    async def close(self):
+        for page in self.pages:
+            page.closed = True
+
+
+class FakeBrowser:
+    async def new_context(self, **kwargs):
+        return FakeContext()
+
+    def is_connected(self):
+        return True
+
+    def on(self, event, listener):
+        pass
+
+    def remove_listener(self, event, listener):
+        pass
+
+
+class FakeBrowserType:
+    async def launch(self, **kwargs):
+        return FakeBrowser()
+
+
+async def _start_playwright(self):
+    self.browser_type = FakeBrowserType()
+    await self._ThreadsafeBrowser__launch({})
+
+
+async def _stop_playwright(self):
+    pass
+
+
+def _browser(monkeypatch, **kwargs):
+    # NOTE: no browser needed, the pool only sees pages and contexts
+    monkeypatch.setattr(ThreadsafeBrowser, "_ThreadsafeBrowser__start_playwright", _start_playwright)
+    monkeypatch.setattr(ThreadsafeBrowser, "_ThreadsafeBrowser__stop_playwright", _stop_playwright)
+    return ThreadsafeBrowser(no_context=False, check_open_dir=False, **kwargs)
+
+
+def _acquire_in_threads(pool, count, timeout):
+    results = []
+
+    def _acquire():
+        try:
+            results.append(pool.acquire_sync(timeout=timeout))
+        except PoolExhausted as e:
+            results.append(e)
+
+    threads = [threading.Thread(target=_acquire) for _ in range(count)]
+    for thread in threads:
+        thread.start()
+    return threads, results
+
+
+def test_release_not_held_back_by_waiting_acquires(monkeypatch):
+    th = _browser(monkeypatch, max_in_flight=2)
+    try:
+        pool = th.pages(max_size=1)
+        page = pool.acquire_sync()
+        threads, results = _acquire_in_threads(pool, 2, timeout=5)
+        time.sleep(0.2)
+
+        # both acquires wait for a page, they must not take the in-flight slots release needs
+        pool.release_sync(page, timeout_=3)
+        time.sleep(0.2)
+        pool.release_sync(next(r for r in results if not isinstance(r, Exception)), timeout_=3)
+        for thread in threads:
+            thread.join(5)
+
+        assert len(results) == 2
+        assert not any(isinstance(r, Exception) for r in results)
+    finally:
+        th.stop()
+
+
+def test_dropped_page_wakes_waiting_acquire(monkeypatch):
+    th = _browser(monkeypatch)
+    try:
+        pool = th.pages(max_size=1)
+        page = pool.acquire_sync()
+        threads, results = _acquire_in_threads(pool, 1, timeout=5)
+        time.sleep(0.2)
+
+        page.closed = True
+        pool.release_sync(page)
+        threads[0].join(5)
+
+        assert len(results) == 1 and not isinstance(results[0], Exception)
+        assert results[0] is not page
+        assert pool.size == 1
+    finally:
+        th.stop()
+
+
+def test_recycle_drops_idle_pages_of_the_old_context(monkeypatch):
+    th = _browser(monkeypatch)
+    try:
+        pool = th.pages(max_size=2)
+        old_pages = [pool.acquire_sync() for _ in range(2)]
+        pool.release_sync(old_pages[0])
+
+        th.recycle_sync()
+        page = pool.acquire_sync(timeout=1)
+        assert not page.is_closed() and page not in old_pages
+
+        # the page in use during the recycle is dropped when given back
+        pool.release_sync(old_pages[1])
+        assert pool.size == 1 and pool.idle == 0
+    finally:
+        th.stop()
+
+
+def test_clear_cookies_needs_isolated_pages(monkeypatch):
+    th = _browser(monkeypatch)
+    try:
+        with pytest.raises(ValueError):
+            th.pages(max_size=1, clear_cookies=True)
+    finally:
+        th.stop()
+
+
+def test_recycle_not_held_up_by_waiting_acquire(monkeypatch):
+    th = _browser(monkeypatch, recycle=RecyclePolicy(drain_timeout=5))
+    try:
+        pool = th.pages(max_size=1)
+        page = pool.acquire_sync()
+        threads, results = _acquire_in_threads(pool, 1, timeout=10)
+        time.sleep(0.2)
+
+        # the waiting acquire is not drained, and the release is not held back during the recycle
+        started = time.perf_counter()
+        recycling = threading.Thread(target=th.recycle_sync)
+        recycling.start()
+        time.sleep(0.2)
+        pool.release_sync(page, timeout_=3)
+        recycling.join(5)
+        threads[0].join(5)
+
+        assert time.perf_counter() - started < 2
+        assert len(results) == 1 and not isinstance(results[0], Exception)
+    finally:
+        th.stop()
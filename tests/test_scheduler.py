@@ -0,0 +1,108 @@
+from concurrent.futures import Future
+
+import pytest
+
+from PlaywrightSafeThread.browser.scheduler import Job, Scheduler
+
+
+class Recorder:
+    def __init__(self, max_in_flight=None):
+        self.started = []
+        self.skipped = []
+        self.scheduler = Scheduler(self.started.append, self.skipped.append, max_in_flight=max_in_flight)
+
+    def push(self, name, key=None, priority=0, caller=1):
+        job = Job(name, Future(), 0.0, key, priority, caller)
+        self.scheduler.push(job)
+        return job
+
+    def finish(self, name):
+        job = next(job for job in self.started if job.coro == name)
+        self.scheduler.done(job)
+
+    @property
+    def names(self):
+        return [job.coro for job in self.started]
+
+
+def test_same_key_runs_one_at_a_time_in_order():
+    recorder = Recorder()
+    recorder.push("a1", key="page-a")
+    recorder.push("a2", key="page-a")
+    recorder.push("b1", key="page-b")
+    recorder.push("a3", key="page-a")
+    assert recorder.names == ["a1", "b1"]
+    assert recorder.scheduler.parked == 2
+
+    recorder.finish("a1")
+    assert recorder.names == ["a1", "b1", "a2"]
+    recorder.finish("a2")
+    assert recorder.names == ["a1", "b1", "a2", "a3"]
+    recorder.finish("a3")
+    assert recorder.scheduler.parked == 0
+    assert recorder.scheduler.snapshot()["by_key"] == {}
+
+
+def test_max_in_flight():
+    recorder = Recorder(max_in_flight=2)
+    for name in ("j1", "j2", "j3", "j4"):
+        recorder.push(name)
+    assert recorder.names == ["j1", "j2"]
+    assert recorder.scheduler.in_flight == 2
+    assert recorder.scheduler.queued == 2
+
+    recorder.finish("j2")
+    assert recorder.names == ["j1", "j2", "j3"]
+    assert recorder.scheduler.in_flight == 2
+
+
+def test_higher_priority_first():
+    recorder = Recorder(max_in_flight=1)
+    recorder.push("running")
+    recorder.push("low", priority=0)
+    recorder.push("high", priority=10)
+    recorder.push("mid", priority=5)
+
+    for name in ("running", "high", "mid"):
+        recorder.finish(name)
+    assert recorder.names == ["running", "high", "mid", "low"]
+
+
+def test_callers_served_round_robin():
+    recorder = Recorder(max_in_flight=1)
+    recorder.push("blocker", caller=0)
+    for index in range(3):
+        recorder.push("flood%i" % index, caller=1)
+    recorder.push("other0", caller=2)
+    recorder.push("other1", caller=2)
+
+    for name in ("blocker", "flood0", "other0", "flood1", "other1"):
+        recorder.finish(name)
+    assert recorder.names == ["blocker", "flood0", "other0", "flood1", "other1", "flood2"]
+
+
+def test_cancelled_jobs_are_skipped_and_release_their_key():
+    recorder = Recorder(max_in_flight=1)
+    recorder.push("running", key="page")
+    cancelled = recorder.push("cancelled", key="page")
+    recorder.push("next", key="page")
+    cancelled.future.cancel()
+
+    recorder.finish("running")
+    assert [job.coro for job in recorder.skipped] == ["cancelled"]
+    assert recorder.names == ["running", "next"]
+    assert recorder.scheduler.in_flight == 1
+
+
+def test_drain_returns_jobs_never_started():
+    recorder = Recorder(max_in_flight=1)
+    recorder.push("running", key="page")
+    recorder.push("parked", key="page")
+    recorder.push("queued")
+    assert sorted(job.coro for job in recorder.scheduler.drain()) == ["parked", "queued"]
+    assert recorder.scheduler.queued == recorder.scheduler.parked == 0
+
+
+def test_max_in_flight_must_be_positive():
+    with pytest.raises(ValueError):
+        Scheduler(lambda job: None, lambda job: None, max_in_flight=0)